@@ -0,0 +1,141 @@
+"""
+Бенчмарк пропускной способности JWTMiddleware
+
+Запросы идут через httpx.ASGITransport в приложение FastAPI с настоящим
+src.middleware.jwt.JWTMiddleware (текущая реализация: чистый ASGI,
+ленивая аутентификация) и с тем же JWTMiddleware.authenticate,
+вызванным из BaseHTTPMiddleware до обработчика (прежняя схема:
+дополнительная задача и поток ответа, аутентификация каждого запроса).
+Токены, сессия в Redis и зависимость JWTCookie - настоящие.
+
+Сценарии:
+- /version без кук;
+- /version с куками авторизованного пользователя (маршрут без JWTCookie);
+- /me с JWTCookie.
+
+Нужен Redis (REDIS_HOST, REDIS_PORT, по умолчанию localhost:6379).
+В числа входит и стоимость httpx-клиента, одинаковая для обоих вариантов.
+
+Запуск:
+    python benchmarks/asgi_middleware.py [количество запросов]
+"""
+import asyncio
+import os
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path[:0] = [ROOT, os.path.dirname(__file__)]
+# error_list.json читается относительно рабочего каталога, как в Dockerfile
+os.chdir(ROOT)
+
+from config_loading import KV  # noqa: E402
+
+os.environ.update(CONFIG_SOURCE="env", MODE="dev", DEBUG="1")
+for key, value in KV.items():
+    os.environ.setdefault("CONFIG__" + key.replace("/", "__"), value)
+os.environ["CONFIG__dev__database__redis__host"] = os.getenv("REDIS_HOST", "localhost")
+os.environ["CONFIG__dev__database__redis__port"] = os.getenv("REDIS_PORT", "6379")
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.requests import Request  # noqa: E402
+from fastapi.responses import JSONResponse, Response  # noqa: E402
+from starlette.authentication import AuthCredentials, UnauthenticatedUser  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from src import utils  # noqa: E402
+from src.dependencies import JWTCookie  # noqa: E402
+from src.middleware.jwt import JWTMiddleware  # noqa: E402
+from src.models import schemas  # noqa: E402
+from src.services.auth import JWTManager, SessionManager  # noqa: E402
+
+SESSION_ID = 900000001
+
+
+class BaseHTTPJWTMiddleware(BaseHTTPMiddleware):
+    """Прежняя схема: BaseHTTPMiddleware и аутентификация до вызова обработчика"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.jwt_middleware = JWTMiddleware(app)
+
+    async def dispatch(self, request: Request, call_next):
+        refreshed: List[schemas.Tokens] = []
+        request.scope["user"] = UnauthenticatedUser()
+        request.scope["auth"] = AuthCredentials()
+        await self.jwt_middleware.authenticate(request, refreshed)
+        response = await call_next(request)
+        if refreshed:
+            self.jwt_middleware.jwt.set_jwt_cookie(response, refreshed[0])
+            self.jwt_middleware.session.set_session_cookie(response, SESSION_ID)
+        return response
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/version")
+    async def version():
+        return JSONResponse({"version": "0.1.0"})
+
+    @app.get("/me")
+    async def me(user=Depends(JWTCookie())):
+        return JSONResponse({"id": user.id})
+
+    app.add_middleware(middleware)
+    return app
+
+
+async def login() -> Dict[str, str]:
+    jwt = JWTManager()
+    tokens = schemas.Tokens(
+        access_token=jwt.generate_access_token(1, "benchmark_user", 11, 1),
+        refresh_token=jwt.generate_refresh_token(1, "benchmark_user", 11, 1),
+    )
+    await SessionManager().save_session(SESSION_ID, tokens.refresh_token)
+    cookies = Response()
+    jwt.set_jwt_cookie(cookies, tokens)
+    SessionManager().set_session_cookie(cookies, SESSION_ID)
+    pairs = [value.decode("latin-1").split(";")[0] for key, value in cookies.raw_headers if key == b"set-cookie"]
+    return {"cookie": "; ".join(pairs)}
+
+
+async def run(app, path: str, headers: Dict[str, str], requests: int) -> float:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        # прогрев
+        for _ in range(100):
+            response = await client.get(path, headers=headers)
+            assert response.status_code == 200, response.text
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get(path, headers=headers)
+        return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int):
+    await utils.RedisClient.open_redis_client()
+    utils.RedisClient.start_listener()
+    auth_headers = await login()
+
+    before_app = build_app(BaseHTTPJWTMiddleware)
+    after_app = build_app(JWTMiddleware)
+    for name, path, headers in (
+            ("/version без кук", "/version", {}),
+            ("/version с куками", "/version", auth_headers),
+            ("/me (JWTCookie)", "/me", auth_headers),
+    ):
+        before = await run(before_app, path, headers, requests)
+        after = await run(after_app, path, headers, requests)
+        print(f"{name:<20} BaseHTTPMiddleware {before:8.0f} req/s   "
+              f"JWTMiddleware {after:8.0f} req/s   {after / before:5.2f}x")
+
+    await SessionManager().delete_session_id(SESSION_ID, Response())
+    await utils.RedisClient.stop_listener()
+    await utils.RedisClient.close_redis_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
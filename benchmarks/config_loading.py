@@ -0,0 +1,161 @@
+"""
+Бенчмарк загрузки конфигурации из Consul при старте приложения
+
+Поднимается локальный HTTP-сервер с API Consul KV, каждый ответ
+задерживается на время сетевого обмена. Сравниваются:
+- старая загрузка: каждый из модулей, вызывающих load_config при импорте,
+  читает каждый ключ отдельным запросом;
+- новая загрузка: один рекурсивный запрос, результат load_config
+  переиспользуется всеми модулями;
+- холодный старт со снимком: ключи читаются из локального файла,
+  Consul нужен только для фоновой сверки.
+
+Запуск:
+    python benchmarks/config_loading.py [задержка ответа, мс] [модулей с load_config]
+"""
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import consul
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("MODE", "dev")
+os.environ.setdefault("DEBUG", "1")
+
+from src import config  # noqa: E402
+
+# Модули, вызывающие load_config при импорте: app, router, controllers/stats,
+# controllers/file_test, services/auth/jwt, services/auth/session,
+# services/storage/s3, utils/redis, utils/password, utils/postgres
+MODULES = 10
+
+KV = {
+    "dev/is_secure_cookie": "0",
+    "base/name": "haha-ton",
+    "base/description": "benchmark",
+    "base/contact/name": "benchmark",
+    "base/contact/url": "http://localhost",
+    "base/contact/email": "benchmark@localhost",
+    "dev/jwt/JWT_ACCESS_SECRET_KEY": "access",
+    "dev/jwt/JWT_REFRESH_SECRET_KEY": "refresh",
+    "dev/database/postgresql/host": "localhost",
+    "dev/database/postgresql/port": "5432",
+    "dev/database/postgresql/username": "postgres",
+    "dev/database/postgresql/password": "postgres",
+    "dev/database/postgresql/name": "postgres",
+    "dev/database/redis/host": "localhost",
+    "dev/database/redis/password": "",
+    "dev/database/redis/port": "6379",
+    "dev/database/s3/endpoint_url": "http://localhost:9000",
+    "dev/database/s3/region_name": "us-east-1",
+    "dev/database/s3/aws_access_key_id": "key",
+    "dev/database/s3/aws_secret_access_key": "secret",
+    "dev/database/s3/bucket": "bucket",
+    "base/email/isTLS": "1",
+    "base/email/isSSL": "0",
+    "base/email/host": "localhost",
+    "base/email/port": "587",
+    "base/email/user": "user",
+    "base/email/password": "password",
+}
+ITEMS = {
+    f"{config.KV_PREFIX}/{key}": {"Key": f"{config.KV_PREFIX}/{key}", "Value": base64.b64encode(value.encode()).decode()}
+    for key, value in KV.items()
+}
+
+
+class ConsulKV(BaseHTTPRequestHandler):
+    delay = 0.0
+    requests = 0
+
+    def do_GET(self):
+        ConsulKV.requests += 1
+        time.sleep(self.delay)
+        url = urlparse(self.path)
+        key = url.path[len("/v1/kv/"):]
+        if "recurse" in parse_qs(url.query, keep_blank_values=True):
+            items = [item for name, item in ITEMS.items() if name.startswith(key)]
+        else:
+            items = [ITEMS[key]] if key in ITEMS else []
+        if not items:
+            self.send_response(404)
+            self.send_header("X-Consul-Index", "1")
+            self.end_headers()
+            return
+        body = json.dumps(items).encode()
+        self.send_response(200)
+        self.send_header("X-Consul-Index", "1")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class PerKeyKV:
+    """Прежнее поведение KVManager: каждый ключ - отдельный запрос к Consul"""
+
+    def __init__(self, kv):
+        self.kv = kv
+
+    def get(self, path):
+        _, data = self.kv.get(path)
+        return data["Value"].decode("utf-8") if data and data["Value"] else None
+
+
+def measure(load) -> tuple:
+    ConsulKV.requests = 0
+    start = time.perf_counter()
+    for _ in range(MODULES):
+        load()
+    return time.perf_counter() - start, ConsulKV.requests
+
+
+def main(delay_ms: float):
+    ConsulKV.delay = delay_ms / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ConsulKV)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    kv = consul.Consul(host="127.0.0.1", port=server.server_address[1]).kv
+
+    old = measure(lambda: config.parse_config(PerKeyKV(kv)))
+
+    @lru_cache(maxsize=None)
+    def load_config():
+        return config.parse_config(config.fetch_kv(kv))
+
+    new = measure(load_config)
+    assert load_config() == config.parse_config(PerKeyKV(kv))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "config.json")
+        config.write_snapshot(path, config.fetch_kv(kv))
+
+        @lru_cache(maxsize=None)
+        def load_snapshot():
+            return config.parse_config(config.read_kv_file(path))
+
+        snapshot = measure(load_snapshot)
+        assert load_snapshot() == load_config()
+    server.shutdown()
+
+    for name, (elapsed, requests) in (
+            ("по ключу в каждом модуле", old),
+            ("один рекурсивный запрос", new),
+            ("снимок в файле", snapshot),
+    ):
+        print(f"{name:<26} {elapsed * 1000:8.1f} мс  запросов к Consul: {requests}")
+
+
+if __name__ == "__main__":
+    MODULES = int(sys.argv[2]) if len(sys.argv) > 2 else MODULES
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
@@ -0,0 +1,74 @@
+"""
+Микробенчмарк реализаций JWT: python-jose против HS256Codec
+
+Измеряет подпись и проверку токена с компактными claims,
+а также полный путь старой реализации (jose + TokenPayload.parse_obj).
+Модуль кодеков загружается напрямую из файла, поэтому конфигурация
+приложения (Consul) для запуска не нужна.
+
+Запуск:
+    python benchmarks/jwt_codec.py [количество итераций]
+"""
+import importlib.util
+import os
+import sys
+import time
+import timeit
+
+from pydantic import BaseModel
+
+SECRET_KEY = "benchmark-secret-key-0123456789abcdef"
+CLAIMS = {"uid": 42, "usr": "benchmark_user", "rol": 11, "sta": 1, "exp": int(time.time()) + 1800}
+LEGACY_CLAIMS = {"id": 42, "username": "benchmark_user", "role_id": 11, "state_id": 1, "exp": int(time.time()) + 1800}
+
+
+class TokenPayload(BaseModel):
+    id: int
+    username: str
+    role_id: int
+    state_id: int
+    exp: int
+
+
+def load_codec_module():
+    path = os.path.join(os.path.dirname(__file__), "..", "src", "services", "auth", "codec.py")
+    spec = importlib.util.spec_from_file_location("jwt_codec", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def report(name: str, number: int, seconds: float):
+    print(f"{name:<40} {seconds / number * 1e6:8.2f} мкс/оп  {number / seconds:10.0f} оп/с")
+
+
+def main(number: int):
+    codec = load_codec_module()
+    jose_codec = codec.JoseCodec()
+    fast_codec = codec.HS256Codec()
+    from jose import jwt
+
+    legacy_token = jwt.encode(LEGACY_CLAIMS, SECRET_KEY, "HS256")
+    jose_token = jose_codec.encode(CLAIMS, SECRET_KEY)
+    fast_token = fast_codec.encode(CLAIMS, SECRET_KEY)
+    assert jose_codec.decode(fast_token, SECRET_KEY) == fast_codec.decode(jose_token, SECRET_KEY)
+
+    print(f"Размер токена: старые claims {len(legacy_token)} байт, компактные {len(fast_token)} байт\n")
+
+    report("encode: jose + TokenPayload (старый)", number, timeit.timeit(
+        lambda: jwt.encode(TokenPayload(**LEGACY_CLAIMS).dict(), SECRET_KEY, "HS256"), number=number))
+    report("encode: JoseCodec", number, timeit.timeit(
+        lambda: jose_codec.encode(CLAIMS, SECRET_KEY), number=number))
+    report("encode: HS256Codec", number, timeit.timeit(
+        lambda: fast_codec.encode(CLAIMS, SECRET_KEY), number=number))
+    print()
+    report("decode: jose + parse_obj (старый)", number, timeit.timeit(
+        lambda: TokenPayload.parse_obj(jwt.decode(legacy_token, SECRET_KEY, algorithms=["HS256"])), number=number))
+    report("decode: JoseCodec", number, timeit.timeit(
+        lambda: jose_codec.decode(jose_token, SECRET_KEY), number=number))
+    report("decode: HS256Codec", number, timeit.timeit(
+        lambda: fast_codec.decode(fast_token, SECRET_KEY), number=number))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
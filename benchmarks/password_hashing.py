@@ -0,0 +1,174 @@
+"""
+Бенчмарк задержки посторонних маршрутов во время шторма логинов
+
+Пока клиенты непрерывно логинятся, отдельный клиент раз в 5 мс
+запрашивает тривиальный маршрут /version и замеряет время ответа
+от запланированного момента отправки.
+Сравниваются проверка пароля прямо в обработчике (старая реализация
+authenticate) и PasswordHasher с пулом потоков и ограничением очереди.
+Запросы подаются напрямую в ASGI-приложение, без сети.
+
+Модуль паролей загружается из файла с минимальной конфигурацией,
+поэтому Consul для запуска не нужен.
+
+Запуск:
+    python benchmarks/password_hashing.py [длительность, с] [одновременных логинов]
+"""
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import time
+import types
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+MAX_WORKERS = 4
+MAX_PENDING = 16
+PROBE_INTERVAL = 0.005
+
+
+def load_password_module():
+    src = os.path.join(os.path.dirname(__file__), "..", "src")
+    config = types.ModuleType("src.config")
+    config.load_config = lambda: types.SimpleNamespace(base=types.SimpleNamespace(
+        password=types.SimpleNamespace(
+            EXECUTOR="thread", MAX_WORKERS=MAX_WORKERS, MAX_PENDING=MAX_PENDING, RETRY_AFTER=1,
+            ALGORITHM="pbkdf2-sha256", TARGET_MS=0
+        )
+    ))
+    # Пакет src без __init__ и остальных модулей: нужен только src.config
+    package = types.ModuleType("src")
+    package.__path__ = [src]
+    sys.modules["src"] = package
+    sys.modules["src.config"] = config
+
+    package = types.ModuleType("bench_utils")
+    package.__path__ = [os.path.join(src, "utils")]
+    sys.modules["bench_utils"] = package
+    for name in ("other", "password"):
+        spec = importlib.util.spec_from_file_location(f"bench_utils.{name}", os.path.join(src, "utils", f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+    return sys.modules["bench_utils.password"]
+
+
+password = load_password_module()
+STORAGE = password.get_hashed_password(
+    "benchmark-password", password.PasswordHasher.ALGORITHM, password.PasswordHasher.params
+)
+
+
+async def version(request: Request):
+    return JSONResponse({"version": "0.1.0"})
+
+
+async def login_inline(request: Request):
+    return JSONResponse({"ok": password.verify_password("benchmark-password", STORAGE)})
+
+
+async def login_offloaded(request: Request):
+    try:
+        ok = await password.PasswordHasher.verify("benchmark-password", STORAGE)
+    except password.PasswordHasherOverloaded as ex:
+        return JSONResponse({"ok": False}, status_code=503, headers={"Retry-After": str(ex.retry_after)})
+    return JSONResponse({"ok": ok})
+
+
+def build_app(login) -> Starlette:
+    return Starlette(routes=[Route("/version", version), Route("/login", login, methods=["POST"])])
+
+
+async def request(app, method: str, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1),
+        "server": ("bench", 80),
+    }
+    received = False
+    status = 0
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def run(app, duration: float, concurrency: int) -> dict:
+    stop = time.perf_counter() + duration
+    latencies = []
+    statuses = {}
+
+    async def login_client():
+        while time.perf_counter() < stop:
+            status = await request(app, "POST", "/login")
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 503:
+                # клиент соблюдает Retry-After в уменьшенном масштабе
+                await asyncio.sleep(0.05)
+
+    async def probe_client():
+        # Задержка считается от запланированного момента отправки: если
+        # event loop занят, ожидание до начала обработки тоже входит в нее
+        scheduled = time.perf_counter()
+        while scheduled < stop:
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            await request(app, "GET", "/version")
+            latencies.append(time.perf_counter() - scheduled)
+            scheduled += PROBE_INTERVAL
+
+    await asyncio.gather(probe_client(), *(login_client() for _ in range(concurrency)))
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies) * 1000,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "max": latencies[-1] * 1000,
+        "probes": len(latencies),
+        "logins": statuses.get(200, 0) / duration,
+        "rejected": statuses.get(503, 0),
+    }
+
+
+def report(name: str, result: dict):
+    print(
+        f"{name:<22} /version p50 {result['p50']:7.2f} мс  p99 {result['p99']:7.2f} мс  "
+        f"max {result['max']:7.2f} мс  ({result['probes']} запросов)  "
+        f"логинов {result['logins']:6.1f}/с  отказов 503: {result['rejected']}"
+    )
+
+
+async def main(duration: float, concurrency: int):
+    report("PBKDF2 в обработчике", await run(build_app(login_inline), duration, concurrency))
+    report("PasswordHasher", await run(build_app(login_offloaded), duration, concurrency))
+    password.PasswordHasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        float(sys.argv[1]) if len(sys.argv) > 1 else 5.0,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 32,
+    ))
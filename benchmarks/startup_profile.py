@@ -0,0 +1,148 @@
+"""
+Профиль старта приложения
+
+1. Импорт src.app под python -X importtime: общее время и самые
+   дорогие модули и пакеты (медиана по нескольким запускам).
+2. Время до первого обслуженного запроса: uvicorn запускается
+   так же, как в Dockerfile, и /version опрашивается до ответа 200.
+
+Конфигурация берется так же, как приложением (CONFIG_SOURCE, CONFIG_FILE,
+CONSUL_HOST, MODE, DEBUG, ...), для запроса нужны доступные Postgres и Redis.
+
+Запуск:
+    python benchmarks/startup_profile.py [запусков импорта] [строк в отчете]
+"""
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+FIRST_REQUEST_TIMEOUT = 60.0
+
+
+def app_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    # Как в Dockerfile: корень проекта - рабочий каталог, модули импортируются через пакет src
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    return env
+
+
+def profile_imports() -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """
+    Один импорт src.app в отдельном процессе
+
+    :return: время импорта в секундах, модуль -> (собственное, накопленное время в мкс)
+    """
+    code = "import time; start = time.perf_counter(); import src.app; print(time.perf_counter() - start)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=app_env(), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        sys.exit(f"Импорт src.app завершился ошибкой:\n{result.stderr[-3000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+def first_request() -> Tuple[Optional[float], Optional[float]]:
+    """
+    Запускает uvicorn и ждет первого ответа 200 на /version
+
+    :return: секунды до "Application startup complete" и до первого ответа от запуска процесса
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.app:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, env=app_env(), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    startup_complete: List[float] = []
+    output: List[str] = []
+
+    def read_output():
+        for line in process.stdout:
+            output.append(line)
+            if "Application startup complete" in line:
+                startup_complete.append(time.perf_counter() - start)
+
+    threading.Thread(target=read_output, daemon=True).start()
+    served = None
+    try:
+        while served is None and time.perf_counter() - start < FIRST_REQUEST_TIMEOUT:
+            if process.poll() is not None:
+                break
+            # С DEBUG маршруты под префиксом /api/v1
+            for path in ("/version", "/api/v1/version"):
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1) as response:
+                        if response.status == 200:
+                            served = time.perf_counter() - start
+                            break
+                except (urllib.error.URLError, ConnectionError, socket.timeout):
+                    pass
+            else:
+                time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait(10)
+    if served is None:
+        print("".join(output[-40:]), file=sys.stderr)
+    return (startup_complete[0] if startup_complete else None), served
+
+
+def report(runs: int, top: int):
+    totals = []
+    samples: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    for _ in range(runs):
+        total, modules = profile_imports()
+        totals.append(total)
+        for name, times in modules.items():
+            samples[name].append(times)
+    median = {
+        name: (statistics.median(t[0] for t in times), statistics.median(t[1] for t in times))
+        for name, times in samples.items()
+    }
+    packages: Dict[str, float] = defaultdict(float)
+    for name, (self_time, _) in median.items():
+        packages[name.split(".")[0]] += self_time
+
+    print(f"Импорт src.app: медиана {statistics.median(totals) * 1000:.0f} мс "
+          f"(мин {min(totals) * 1000:.0f}, макс {max(totals) * 1000:.0f}, запусков {runs})")
+    print("\nМодули по накопленному времени, мс:")
+    for name, (self_time, cumulative) in sorted(median.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"  {cumulative / 1000:8.1f}  {self_time / 1000:8.1f}  {name}")
+    print("\nПакеты по собственному времени модулей, мс:")
+    for name, self_time in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        print(f"  {self_time / 1000:8.1f}  {name}")
+
+    startup, served = first_request()
+    print()
+    if startup is not None:
+        print(f"До Application startup complete: {startup * 1000:.0f} мс")
+    if served is None:
+        print("Первый запрос не обслужен")
+    else:
+        print(f"До первого обслуженного запроса: {served * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    report(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 25,
+    )
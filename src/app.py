@@ -1,21 +1,25 @@
 """Application implementation - ASGI."""
+import asyncio
 import logging
-import urllib.parse
 
 from fastapi import FastAPI
 from fastapi.exceptions import RequestValidationError
 from fastapi.openapi.utils import get_openapi
 from tortoise.contrib.fastapi import register_tortoise
 
-from middleware import JWTMiddleware
-from config import load_config
-from exceptions.api import APIError
-from exceptions.api import not_found_exception_handler
-from exceptions.api import validation_exception_handler
-from exceptions.api import api_exception_handler
+from src.middleware import JWTMiddleware
+from src.config import ConfigWatcher, load_config
+from src.exceptions.api import APIError
+from src.exceptions.api import not_found_exception_handler
+from src.exceptions.api import validation_exception_handler
+from src.exceptions.api import api_exception_handler
+from src.exceptions.api import overloaded_exception_handler
 
-from router import root_api_router
-from utils import RedisClient, AiohttpClient
+from src.router import root_api_router
+from src.services import repository
+from src.services.user_import import UserImporter
+from src.services.warmup import WarmupManager
+from src.utils import RedisClient, PostgresClient, AiohttpClient, PasswordHasher, PasswordHasherOverloaded
 
 config = load_config()
 log = logging.getLogger(__name__)
@@ -38,15 +42,8 @@ app = FastAPI(
 
 register_tortoise(
     app,
-    db_url="postgres://{user}:{password}@{host}:{port}/{database}".format(
-        user=config.db.postgresql.username,
-        password=urllib.parse.quote_plus(config.db.postgresql.password),
-        host=config.db.postgresql.host,
-        port=config.db.postgresql.port,
-        database=config.db.postgresql.database
-    ),
-    modules={"models": ["src.models.tables"]},
-    generate_schemas=True,
+    config=PostgresClient.tortoise_config({"models": ["src.models.tables"]}),
+    generate_schemas=config.db.postgresql.generate_schemas,
     add_exception_handlers=True,
 )
 
@@ -54,18 +51,33 @@ register_tortoise(
 @app.on_event("startup")
 async def on_startup():
     log.debug("Выполнение обработчика события старта FastAPI.")
+    ConfigWatcher.start(asyncio.get_running_loop())
     if config.db.redis:
         await RedisClient.open_redis_client()
+        RedisClient.start_listener()
+    PostgresClient.start_replica_monitor()
     AiohttpClient.get_aiohttp_client()
+    await PasswordHasher.calibrate()
+    if config.db.postgresql.generate_schemas:
+        await repository.user.ensure_indexes()
+    else:
+        await repository.user.check_indexes()
+    WarmupManager.start(app)
 
 
 @app.on_event("shutdown")
 async def on_shutdown():
     log.debug("Выполнение обработчика события закрытия FastAPI.")
+    await WarmupManager.stop()
+    ConfigWatcher.stop()
     # Gracefully close utilities.
     if config.db.redis:
+        await RedisClient.stop_listener()
         await RedisClient.close_redis_client()
+    await PostgresClient.stop_replica_monitor()
     await AiohttpClient.close_aiohttp_client()
+    PasswordHasher.shutdown()
+    UserImporter.shutdown()
 
 
 # custom OpenApi
@@ -98,7 +110,19 @@ log.debug("Добавление маршрутов приложения.")
 app.include_router(root_api_router)
 log.debug("Регистрация обработчиков исключений.")
 app.add_exception_handler(APIError, api_exception_handler)
+app.add_exception_handler(PasswordHasherOverloaded, overloaded_exception_handler)
 app.add_exception_handler(404, not_found_exception_handler)
 app.add_exception_handler(RequestValidationError, validation_exception_handler)
 log.debug("Регистрация промежуточного ПО.")
-app.add_middleware(JWTMiddleware)
+app.add_middleware(
+    JWTMiddleware,
+    # Маршруты, которым аутентификация не нужна вовсе
+    exclude_paths=[
+        root_api_router.prefix + "/version",
+        root_api_router.prefix + "/ready",
+        root_api_router.prefix + "/test",
+        app.docs_url,
+        app.redoc_url,
+        app.openapi_url,
+    ]
+)
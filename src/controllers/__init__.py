@@ -2,3 +2,4 @@ from . import auth
 from . import user
 from . import stats
 from . import file_test
+from . import admin
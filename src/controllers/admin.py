@@ -0,0 +1,141 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Optional, Tuple
+
+from fastapi import APIRouter, Depends, File, Query, UploadFile
+from fastapi.responses import StreamingResponse
+
+from src.models import Role, M, A
+from src.config import load_docs
+from src.dependencies import JWTCookie, MinRoleFilter
+from src.exceptions.api import APIError
+from src.views import ErrorAPIResponse, ImportReportResponse, UsersPageResponse
+
+from src.services import repository
+from src.services.user_import import UserImporter
+
+router = APIRouter(
+    responses={"400": {"model": ErrorAPIResponse}},
+    dependencies=[Depends(JWTCookie()), Depends(MinRoleFilter(Role(M.administrator, A.one)))]
+)
+docs = load_docs("admin.ini")
+
+EXPORT_COLUMNS = (
+    "id", "username", "email", "first_name", "last_name",
+    "role_id", "state_id", "create_time", "update_time"
+)
+# Строк в одной порции ответа выгрузки
+EXPORT_CHUNK_SIZE = 500
+
+
+@router.get(
+    "/users",
+    response_model=UsersPageResponse,
+    summary=docs["users"]["summary"],
+    description=docs["users"]["description"]
+)
+async def get_users(
+        limit: int = Query(50, ge=1, le=500),
+        cursor: Optional[str] = None,
+        state_id: Optional[int] = None,
+        role_id: Optional[int] = None
+):
+    users = await repository.user.get_users_page(
+        limit,
+        after=decode_cursor(cursor) if cursor else None,
+        state_id=state_id,
+        role_id=role_id
+    )
+    next_cursor = None
+    if len(users) == limit:
+        next_cursor = encode_cursor(users[-1].create_time, users[-1].id)
+    return UsersPageResponse(users=users, next_cursor=next_cursor)
+
+
+@router.get(
+    "/users/export",
+    summary=docs["users_export"]["summary"],
+    description=docs["users_export"]["description"]
+)
+async def export_users(
+        format: str = Query("ndjson", regex="^(ndjson|csv)$"),
+        state_id: Optional[int] = None,
+        role_id: Optional[int] = None
+):
+    records = repository.user.iter_users(state_id=state_id, role_id=role_id)
+    if format == "csv":
+        return StreamingResponse(
+            export_csv(records),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="users.csv"'}
+        )
+    return StreamingResponse(
+        export_ndjson(records),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="users.ndjson"'}
+    )
+
+
+@router.post(
+    "/users/import",
+    response_model=ImportReportResponse,
+    summary=docs["users_import"]["summary"],
+    description=docs["users_import"]["description"]
+)
+async def import_users(
+        file: UploadFile = File(...),
+        format: Optional[str] = Query(None, regex="^(ndjson|csv)$")
+):
+    if format is None:
+        format = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+    return await UserImporter.import_file(file.file, format)
+
+
+def encode_cursor(create_time: datetime, user_id: int) -> str:
+    value = json.dumps([create_time.isoformat(), user_id])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        create_time, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(create_time), int(user_id)
+    except (ValueError, TypeError):
+        raise APIError(api_code=900)
+
+
+async def export_ndjson(records: AsyncIterator) -> AsyncIterator[str]:
+    lines = []
+    async for record in records:
+        lines.append(json.dumps(dict(record), default=_isoformat, ensure_ascii=False))
+        if len(lines) >= EXPORT_CHUNK_SIZE:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+async def export_csv(records: AsyncIterator) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    rows = 0
+    async for record in records:
+        writer.writerow([
+            _isoformat(record[column]) if isinstance(record[column], datetime) else record[column]
+            for column in EXPORT_COLUMNS
+        ])
+        rows += 1
+        if rows >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    yield buffer.getvalue()
+
+
+def _isoformat(value: datetime) -> str:
+    return value.isoformat()
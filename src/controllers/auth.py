@@ -3,6 +3,7 @@ import logging
 from fastapi import APIRouter, Depends
 from fastapi.requests import Request
 from fastapi.responses import Response
+from tortoise.exceptions import IntegrityError
 from tortoise.functions import Upper
 
 from src.config import load_docs
@@ -30,11 +31,16 @@ async def sign_up(
 ):
     if is_auth:
         raise APIError(920)
-    if await repository.user.get_user(username__iexact=user.username):
-        raise APIError(903)
-    elif await repository.user.get_user(email__iexact=user.email):
-        raise APIError(922)
-    return await repository.user.create_user(**user.dict())
+    # Занятые username и email определяются уникальными индексами за один INSERT
+    try:
+        return await repository.user.create_user(**user.dict())
+    except IntegrityError as ex:
+        field = repository.user.get_conflict_field(ex)
+        if field == "username":
+            raise APIError(903)
+        if field == "email":
+            raise APIError(922)
+        raise ex
 
 
 @router.post(
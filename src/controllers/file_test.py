@@ -5,12 +5,12 @@ from fastapi import File, UploadFile
 from fastapi.responses import StreamingResponse
 from fastapi.responses import Response
 
-from services.storage.base import ContentType
-from services.storage.s3 import S3
+from src.services.storage.base import ContentType
+from src.services.storage.s3 import S3
 from src.config import load_config
 
-import utils
-from views import ErrorAPIResponse
+from src import utils
+from src.views import ErrorAPIResponse
 
 router = APIRouter(responses={"400": {"model": ErrorAPIResponse}})
 config = load_config()
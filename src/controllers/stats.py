@@ -1,9 +1,16 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
 
 from src.config import load_config
+from src.dependencies import JWTCookie, MinRoleFilter
+from src.models import Role, M, A
 
-import utils
-from views import ErrorAPIResponse
+from src import utils
+from src.services.auth import JWTManager, SessionManager
+from src.services import repository
+from src.services.repository.cache import UserCache
+from src.services.warmup import WarmupManager
+from src.views import ErrorAPIResponse
 
 router = APIRouter(responses={"400": {"model": ErrorAPIResponse}})
 config = load_config()
@@ -28,8 +35,29 @@ async def version(details: bool = False):
     return info
 
 
+@router.get("/ready")
+async def ready():
+    # Проверка готовности для балансировщика: 503, пока воркер не прогрет
+    return JSONResponse(WarmupManager.stats(), status_code=200 if WarmupManager.ready else 503)
+
+
 @router.get("/test")
 async def test():
     return {
         "Redis": await utils.RedisClient.ping(),
     }
+
+
+# Размеры пулов, задержка реплик, ошибки прогрева - только для администраторов
+@router.get("/metrics", dependencies=[Depends(JWTCookie()), Depends(MinRoleFilter(Role(M.administrator, A.one)))])
+async def metrics():
+    return {
+        "jwt_cache": JWTManager.token_cache.stats(),
+        "session_cache": SessionManager.cache.stats(),
+        "redis_pool": utils.RedisClient.pool_stats(),
+        "postgres_pool": utils.PostgresClient.pool_stats(),
+        "password_hasher": utils.PasswordHasher.stats(),
+        "user_cache": UserCache.stats(),
+        "user_loader": repository.user.user_loader.stats(),
+        "warmup": WarmupManager.stats(),
+    }
@@ -1,36 +1,57 @@
 import logging
+from typing import List
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Path, Query
 from fastapi.requests import Request
 from fastapi.responses import Response
+from tortoise.exceptions import IntegrityError
 
-from models import schemas
+from src.models import schemas
 from src.config import load_docs
 from src.dependencies import JWTCookie
 from src.exceptions.api import APIError
 from src import utils
 from src.services.auth import logout
-from views import ErrorAPIResponse
-from views import UserResponse
-from views import UserOutResponse
+from src.views import ErrorAPIResponse
+from src.views import UserResponse
+from src.views import UserOutResponse
 
 from src.services import repository
 
 router = APIRouter(responses={"400": {"model": ErrorAPIResponse}})
 docs = load_docs("auth.ini")
 
+MAX_BATCH_IDS = 100
+# "user"."id" - integer: большее значение ломает запрос, а не просто ничего не находит
+MAX_USER_ID = 2 ** 31 - 1
+
 
 @router.get("/current", dependencies=[Depends(JWTCookie())], response_model=UserResponse)
 async def get_current_user(request: Request):
-    user = await repository.user.get_user(id=request.user.id)
+    user = await repository.user.get_user_record(request.user.id)
     if not user:
         raise APIError(api_code=404)
     return user
 
 
+@router.get("", response_model=List[UserOutResponse])
+async def get_users(ids: str = Query(..., description="id пользователей через запятую")):
+    try:
+        # Порядок запроса сохраняется, повторы отбрасываются
+        user_ids = list(dict.fromkeys(int(user_id) for user_id in ids.split(",") if user_id.strip()))
+    except ValueError:
+        raise APIError(api_code=900)
+    if any(not 1 <= user_id <= MAX_USER_ID for user_id in user_ids):
+        raise APIError(api_code=900)
+    if len(user_ids) > MAX_BATCH_IDS:
+        raise APIError(api_code=924)
+    users = await repository.user.get_users_by_ids(user_ids)
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
+
 @router.get("/{user_id}", response_model=UserOutResponse)
-async def get_user(user_id: int):
-    user = await repository.user.get_user(id=user_id)
+async def get_user(user_id: int = Path(..., ge=1, le=MAX_USER_ID)):
+    user = await repository.user.get_user_record(user_id)
     if not user:
         raise APIError(api_code=904)
     return user
@@ -38,7 +59,14 @@ async def get_user(user_id: int):
 
 @router.post("/update", dependencies=[Depends(JWTCookie())], response_model=UserResponse)
 async def update_user(data: schemas.UserUpdate, request: Request):
-    user = await repository.user.update_user(request.user.id, **data.dict(exclude_unset=True))
+    try:
+        user = await repository.user.update_user(request.user.id, **data.dict(exclude_unset=True))
+    except IntegrityError as ex:
+        if repository.user.get_conflict_field(ex) == "username":
+            raise APIError(903)
+        raise ex
+    if not user:
+        raise APIError(api_code=904)
     return user
 
 
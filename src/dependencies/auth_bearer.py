@@ -15,6 +15,10 @@ class JWTCookie:
         self.auto_error = auto_error
 
     async def __call__(self, request: Request, response: Response):
+        # Ленивая аутентификация, см. JWTMiddleware
+        authenticate = request.scope.get("authenticate")
+        if authenticate is not None:
+            await authenticate()
         if request.user.is_authenticated:
             if request.user.state == UserStates.blocked:
                 if self.auto_error:
@@ -1,13 +1,14 @@
-from fastapi import Request
+from fastapi import Request, Response
 
-from exceptions.api import APIError
-from models import Role
+from src.exceptions.api import APIError
+from src.models import Role
+from .auth_bearer import JWTCookie
 
 
 class MinRoleFilter:
     """
-    Зависимость должна быть использована
-    только в авторизованном пространстве
+    Зависимость сама аутентифицирует запрос (как JWTCookie),
+    поэтому ее можно использовать и без JWTCookie в маршруте
 
     """
 
@@ -21,9 +22,14 @@ class MinRoleFilter:
         """
         self._role: Role = role
         self._auto_error = auto_error
+        self._jwt_cookie = JWTCookie(auto_error=auto_error)
 
-    def __call__(self, request: Request) -> None:
-        user_role: Role = request.user.role
+    async def __call__(self, request: Request, response: Response) -> None:
+        # Аутентификация ленивая: без этого request.user - всегда анонимный пользователь
+        user = await self._jwt_cookie(request, response)
+        if user is None:
+            return
+        user_role: Role = user.role
         if user_role.value() >= self._role.value(): # todo после дополнения роли, исправить
             return
 
@@ -3,7 +3,7 @@ import typing
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.responses import JSONResponse
 
-from views import ErrorAPIResponse, Error
+from src.views import ErrorAPIResponse, Error
 
 with open("error_list.json", "r", encoding="utf-8") as file:
     error_list = json.load(file)
@@ -63,5 +63,13 @@ async def api_exception_handler(request, exc):
                 code=exc.api_code,
                 message=data["message"]
             )
-        ).dict()
+        ).dict(),
+        headers=exc.headers
+    )
+
+
+async def overloaded_exception_handler(request, exc):
+    return await api_exception_handler(
+        request,
+        APIError(923, headers={"Retry-After": str(exc.retry_after)})
     )
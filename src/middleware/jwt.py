@@ -1,90 +1,147 @@
+from typing import List, Optional, Sequence
+
 from starlette.authentication import AuthCredentials, UnauthenticatedUser, BaseUser
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from fastapi.responses import Response
 from fastapi.requests import Request
 
-from models import schemas, Role, UserStates
-from services.auth import JWTManager
-from services.auth import SessionManager
-from services import repository
+from src.models import schemas, Role, UserStates
+from src.services.auth import JWTManager
+from src.services.auth import SessionManager
+from src.services.auth import TokenRefresher
+from src.services.auth import VerifiedTokens
+
+
+class JWTMiddleware:
+    """
+    ASGI-middleware аутентификации по JWT в куках
 
+    В отличие от BaseHTTPMiddleware не создает дополнительную задачу
+    и поток ответа: тело ответа проходит насквозь без изменений,
+    а обновленные куки дописываются в заголовки http.response.start
 
-class JWTMiddleware(BaseHTTPMiddleware):
+    Аутентификация ленивая: middleware только кладет в scope["authenticate"]
+    корутину, которую вызывают зависимости JWTCookie и MinRoleFilter.
+    request.user заполняется только этой корутиной: в обработчике
+    и зависимостях без JWTCookie/MinRoleFilter это всегда UnauthenticatedUser,
+    поэтому анонимные маршруты не разбирают токены и не обращаются к Redis.
+    Маршруты из exclude_paths не получают и корутину
+    """
 
     def __init__(
             self,
-            app,
+            app: ASGIApp,
             jwt: JWTManager = JWTManager(),
             session: SessionManager = SessionManager(),
+            refresher: TokenRefresher = TokenRefresher(),
+            exclude_paths: Sequence[str] = (),
     ):
-        super().__init__(app)
+        self.app = app
 
         self.jwt = jwt
         self.session = session
-        self.UserRepo = repository.user
-
-    async def dispatch(self, request: Request, call_next):
+        self.refresher = refresher
+        self.exclude_paths = frozenset(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        scope["user"] = UnauthenticatedUser()
+        scope["auth"] = AuthCredentials()
+        if scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+
+        request = Request(scope)
+        refreshed: List[Optional[schemas.Tokens]] = []
+        is_authenticated = False
+
+        async def authenticate() -> None:
+            # Зависимости FastAPI разрешаются последовательно,
+            # поэтому флага достаточно, чтобы проверка выполнилась один раз
+            nonlocal is_authenticated
+            if not is_authenticated:
+                is_authenticated = True
+                await self.authenticate(request, refreshed)
+
+        scope["authenticate"] = authenticate
+
+        async def send_wrapper(message: Message) -> None:
+            # ----- post_process -----
+            if message["type"] == "http.response.start" and refreshed:
+                # Обновляем заголовки ответа
+                cookies = Response()
+                if refreshed[0] is None:
+                    self.jwt.delete_jwt_cookie(cookies)
+                    self.session.delete_session_cookie(cookies)
+                else:
+                    self.jwt.set_jwt_cookie(cookies, refreshed[0])
+                    self.session.set_session_cookie(cookies, self.session.get_session_id(request))
+                headers = MutableHeaders(scope=message)
+                for key, value in cookies.raw_headers:
+                    if key == b"set-cookie":
+                        headers.append("set-cookie", value.decode("latin-1"))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def authenticate(self, request: Request, refreshed: List[Optional[schemas.Tokens]]) -> None:
+        """
+        Проверяет токены запроса, при необходимости обновляет их
+        и устанавливает request.user
+
+        :param request:
+        :param refreshed: сюда добавляется новая пара токенов для установки в куки
+            или None, если обновить не удалось и куки нужно удалить
+        :return:
+        """
         session_id = self.session.get_session_id(request)
-        current_tokens = self.jwt.get_jwt_cookie(request)
+        verified = self.jwt.get_verified_jwt_cookie(request)
+        payload: Optional[schemas.TokenPayload] = None
         is_need_update = False
         is_auth = False
 
-        # ----- pre_process -----
-        # Проверка авторизации
-        if current_tokens:
-            is_valid_access_token = self.jwt.is_valid_access_token(current_tokens.access_token)
-            is_valid_refresh_token = self.jwt.is_valid_refresh_token(current_tokens.refresh_token)
-            is_valid_session = False
-
-            if is_valid_refresh_token:
-                # Проверка валидности сессии
-                if await self.session.is_valid_session(session_id, current_tokens.refresh_token):
-                    is_valid_session = True
+        # Проверка авторизации: каждый токен проверяется не более одного раза
+        if verified:
+            access = verified.access
+            payload = access.payload
 
-            is_auth = is_valid_access_token and is_valid_refresh_token and is_valid_session
-            is_need_update = (not is_valid_access_token) and is_valid_refresh_token and is_valid_session
+            if access.is_valid and self.jwt.IS_STATELESS:
+                # Stateless-режим: валидному access-токену доверяем без обращения к Redis
+                is_auth = True
+            elif verified.refresh.is_valid:
+                if access.is_valid:
+                    # Проверка валидности сессии
+                    is_auth = await self.session.is_valid_session(session_id, verified.tokens.refresh_token)
+                else:
+                    # Валидность сессии проверяется при ротации токенов
+                    is_need_update = True
 
         # Обновление токенов
         if is_need_update:
-            user_id = self.jwt.decode_refresh_token(current_tokens.refresh_token).id
-            user = await self.UserRepo.get_user(id=user_id)
-            if user:
-                new_payload = schemas.TokenPayload(
-                    id=user.id,
-                    username=user.username,
-                    role_id=user.role_id,
-                    state_id=user.state_id,
-                    exp=0
-                )  # exp не используется, но нужно для составления модели
-                new_tokens = schemas.Tokens(
-                    access_token=self.jwt.generate_access_token(**new_payload.dict()),
-                    refresh_token=self.jwt.generate_refresh_token(**new_payload.dict())
-                )
+            result = await self.refresher.refresh(
+                session_id,
+                verified.tokens.refresh_token,
+                verified.refresh.payload.id
+            )
+            if result:
                 # Для бесшовного обновления токенов:
-                request.cookies["access_token"] = new_tokens.access_token
-                request.cookies["refresh_token"] = new_tokens.refresh_token
-                current_tokens = new_tokens
+                request.scope["jwt"] = VerifiedTokens(self.jwt, result.tokens)
+                refreshed.append(result.tokens)
+                payload = result.payload
                 is_auth = True
+            else:
+                # Сессия недействительна или пользователь заблокирован
+                refreshed.append(None)
 
         # Установка данных авторизации
         if is_auth:
-            payload: schemas.TokenPayload = self.jwt.decode_access_token(current_tokens.access_token)
             request.scope["user"] = AuthenticatedUser(**payload.dict())
             request.scope["auth"] = AuthCredentials(["authenticated"])
-        else:
-            request.scope["user"] = UnauthenticatedUser()
-            request.scope["auth"] = AuthCredentials()
-
-        response = await call_next(request)
-
-        # ----- post_process -----
-        if is_need_update:
-            # Обновляем response
-            self.jwt.set_jwt_cookie(response, current_tokens)
-            await self.session.set_session_id(response, current_tokens.refresh_token, session_id)
-
-        return response
 
 
 class AuthenticatedUser(BaseUser):
@@ -94,18 +151,23 @@ class AuthenticatedUser(BaseUser):
         self.role_id = role_id
         self.state_id = state_id
 
+    @property
     def is_authenticated(self) -> bool:
         return True
 
+    @property
     def display_name(self) -> str:
         return self.username
 
+    @property
     def identity(self) -> int:
         return self.id
 
+    @property
     def role(self) -> Role:
         return Role.from_int(self.role_id)
 
+    @property
     def state(self) -> UserStates:
         return UserStates(self.state_id)
 
@@ -12,3 +12,8 @@ class TokenPayload(BaseModel):
     role_id: int
     state_id: int
     exp: int
+
+
+class RefreshedTokens(BaseModel):
+    tokens: Tokens
+    payload: TokenPayload
@@ -1,11 +1,12 @@
 from fastapi import APIRouter
 
-from controllers import auth
-from controllers import user
-from controllers import stats
-from controllers import file_test
+from src.controllers import auth
+from src.controllers import user
+from src.controllers import stats
+from src.controllers import file_test
+from src.controllers import admin
 
-from config import load_config
+from src.config import load_config
 
 config = load_config()
 
@@ -15,3 +16,4 @@ root_api_router.include_router(auth.router, prefix="/auth", tags=["Auth"])
 root_api_router.include_router(user.router, prefix="/user", tags=["User"])
 root_api_router.include_router(file_test.router, prefix="/file", tags=["File"])
 root_api_router.include_router(stats.router, prefix="", tags=["Stats"])
+root_api_router.include_router(admin.router, prefix="/admin", tags=["Admin"])
@@ -1,3 +1,4 @@
-from .jwt import JWTManager
+from .jwt import JWTManager, TokenStatus, VerifiedToken, VerifiedTokens
 from .session import SessionManager
+from .refresh import TokenRefresher
 from .auth import authenticate, logout, refresh_tokens
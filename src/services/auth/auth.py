@@ -5,7 +5,8 @@ from src import utils
 from src.exceptions.api import APIError
 from src.models import UserStates, schemas
 from src.services import repository
-from . import JWTManager, SessionManager
+from . import JWTManager, SessionManager, TokenRefresher
+from .jwt import TokenStatus, VerifiedTokens
 
 
 async def authenticate(
@@ -26,17 +27,21 @@ async def authenticate(
     :return:
     """
 
-    user = await repository.user.get_user(username=login)
-    if not user:
+    login_record = await repository.user.get_login_record(login)
+    if not login_record:
         raise APIError(904)
-    if not utils.verify_password(password, user.hashed_password):
+    hashed_password = login_record["hashed_password"]
+    if not await utils.PasswordHasher.verify(password, hashed_password):
         raise APIError(905)
+    user = repository.user.to_record(login_record)
     if UserStates(user.state_id) == UserStates.not_confirmed:
         raise APIError(907)
     if UserStates(user.state_id) == UserStates.blocked:
         raise APIError(906)
     if UserStates(user.state_id) == UserStates.deleted:
         raise APIError(904)
+    if utils.PasswordHasher.needs_rehash(hashed_password):
+        await _rehash_password(user.id, hashed_password, password)
     # установка токенов
     tokens = schemas.Tokens(
         access_token=jwt.generate_access_token(user.id, user.username, user.role_id, user.state_id),
@@ -47,6 +52,23 @@ async def authenticate(
     return user
 
 
+async def _rehash_password(user_id: int, hashed_password: str, password: str) -> None:
+    """
+    Пересчитывает хеш пароля под текущие алгоритм и параметры.
+    Пароль известен только в момент входа, поэтому хеш обновляется здесь.
+    При перегрузке пересчет откладывается до следующего входа.
+
+    :param user_id:
+    :param hashed_password: текущий хеш
+    :param password:
+    """
+    try:
+        new_hash = await utils.PasswordHasher.hash(password)
+    except utils.PasswordHasherOverloaded:
+        return
+    await repository.user.update_password_hash(user_id, hashed_password, new_hash)
+
+
 async def logout(
         request: Request,
         response: Response,
@@ -61,47 +83,40 @@ async def logout(
     :param session:
     :return:
     """
+    verified = jwt.get_verified_jwt_cookie(request)
     jwt.delete_jwt_cookie(response)
-    await session.delete_session_id(session.get_session_id(request), response)
+    if verified and verified.refresh.status != TokenStatus.invalid:
+        # Сессию в Redis трогаем только для подлинного refresh-токена
+        await session.delete_session_id(session.get_session_id(request), response)
+    else:
+        session.delete_session_cookie(response)
 
 
 async def refresh_tokens(
         request: Request,
         response: Response,
         jwt: JWTManager = JWTManager(),
-        session: SessionManager = SessionManager()
+        session: SessionManager = SessionManager(),
+        refresher: TokenRefresher = TokenRefresher()
 ):
     """
     Обновление токенов
     :param request:
     :param response:
-    :param user_repo:
     :param jwt:
     :param session:
+    :param refresher:
     :return:
     """
-    current_tokens = jwt.get_jwt_cookie(request)
+    verified = jwt.get_verified_jwt_cookie(request)
+    if not verified or not verified.refresh.is_valid:
+        raise APIError(910)
     session_id = session.get_session_id(request)
-    user = await repository.user.get_user(id=jwt.decode_refresh_token(current_tokens.refresh_token).id)
-
-    if not (UserStates(user.state_id) == UserStates.active):
-        raise APIError(906)
+    refreshed = await refresher.refresh(session_id, verified.tokens.refresh_token, verified.refresh.payload.id)
+    if not refreshed:
+        raise APIError(910)
 
-    new_payload = schemas.TokenPayload(
-        id=user.id,
-        username=user.username,
-        state_id=user.state_id,
-        role_id=user.role_id,
-        exp=0
-    )  # exp не используется, но нужно для составления модели
-
-    new_tokens = schemas.Tokens(
-        access_token=jwt.generate_access_token(**new_payload.dict()),
-        refresh_token=jwt.generate_refresh_token(**new_payload.dict())
-    )
-    jwt.set_jwt_cookie(response, new_tokens)
+    jwt.set_jwt_cookie(response, refreshed.tokens)
+    session.set_session_cookie(response, session_id)
     # Для бесшовного обновления токенов:
-    request.cookies["access_token"] = new_tokens.access_token
-    request.cookies["refresh_token"] = new_tokens.refresh_token
-
-    await session.set_session_id(response, new_tokens.refresh_token, session_id)
+    request.scope["jwt"] = VerifiedTokens(jwt, refreshed.tokens)
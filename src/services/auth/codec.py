@@ -0,0 +1,143 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+from abc import ABC, abstractmethod
+from typing import Dict
+
+
+class TokenDecodeError(Exception):
+    """Токен поврежден, подделан или имеет неверный формат"""
+
+
+class TokenExpiredError(TokenDecodeError):
+    """Срок действия токена истек"""
+
+
+class JWTCodec(ABC):
+    """Кодирование и декодирование JWT без интерпретации claims"""
+
+    @abstractmethod
+    def encode(self, claims: dict, secret_key: str) -> str:
+        """
+        Подписывает claims и собирает токен
+        :param claims:
+        :param secret_key:
+        :return: токен
+        """
+        pass
+
+    @abstractmethod
+    def decode(self, token: str, secret_key: str) -> dict:
+        """
+        Проверяет подпись токена и возвращает claims.
+        Срок действия не проверяется
+        :param token:
+        :param secret_key:
+        :return: claims
+        :raises TokenDecodeError:
+        """
+        pass
+
+
+class JoseCodec(JWTCodec):
+    """Реализация на python-jose"""
+
+    def __init__(self, algorithm: str = "HS256"):
+        from jose import jwt
+
+        self.algorithm = algorithm
+        self._jwt = jwt
+
+    def encode(self, claims: dict, secret_key: str) -> str:
+        return self._jwt.encode(claims, secret_key, self.algorithm)
+
+    def decode(self, token: str, secret_key: str) -> dict:
+        from jose import JWTError
+
+        try:
+            return self._jwt.decode(token, secret_key, algorithms=[self.algorithm], options={"verify_exp": False})
+        except JWTError as ex:
+            raise TokenDecodeError(str(ex)) from ex
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class HS256Codec(JWTCodec):
+    """
+    Быстрая реализация HS256
+
+    HMAC-ключ вычисляется один раз на секрет, заголовок закодирован заранее,
+    claims сериализуются без пробелов. Токены совместимы со стандартным JWT
+    и взаимозаменяемы с JoseCodec
+    """
+    HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode("utf-8"))
+
+    def __init__(self):
+        self._macs: Dict[str, "hmac.HMAC"] = {}
+
+    def _mac(self, secret_key: str) -> "hmac.HMAC":
+        mac = self._macs.get(secret_key)
+        if mac is None:
+            mac = hmac.new(secret_key.encode("utf-8"), digestmod=hashlib.sha256)
+            self._macs[secret_key] = mac
+        return mac.copy()
+
+    def encode(self, claims: dict, secret_key: str) -> str:
+        payload = json.dumps(claims, separators=(",", ":")).encode("utf-8")
+        signing_input = self.HEADER + b"." + _b64encode(payload)
+        mac = self._mac(secret_key)
+        mac.update(signing_input)
+        return (signing_input + b"." + _b64encode(mac.digest())).decode("ascii")
+
+    def decode(self, token: str, secret_key: str) -> dict:
+        try:
+            raw = token.encode("ascii")
+        except UnicodeEncodeError:
+            raise TokenDecodeError("Invalid token encoding.")
+        signing_input, _, signature = raw.rpartition(b".")
+        header, _, payload = signing_input.partition(b".")
+        if not header or not payload or b"." in payload:
+            raise TokenDecodeError("Not enough segments")
+
+        try:
+            if header != self.HEADER:
+                # Заголовок другого формата (например, с иным порядком полей)
+                header_data = json.loads(_b64decode(header))
+                if not isinstance(header_data, dict) or header_data.get("alg") != "HS256":
+                    raise TokenDecodeError("The specified alg value is not allowed")
+
+            mac = self._mac(secret_key)
+            mac.update(signing_input)
+            if not hmac.compare_digest(mac.digest(), _b64decode(signature)):
+                raise TokenDecodeError("Signature verification failed.")
+
+            claims = json.loads(_b64decode(payload))
+        except (binascii.Error, ValueError) as ex:
+            raise TokenDecodeError(str(ex)) from ex
+
+        if not isinstance(claims, dict):
+            raise TokenDecodeError("Invalid payload string: must be a json object")
+        return claims
+
+
+CODECS = {
+    "hs256": HS256Codec,
+    "jose": JoseCodec,
+}
+
+
+def get_codec(name: str) -> JWTCodec:
+    """
+    Выдает реализацию JWT по имени из конфигурации
+    :param name: hs256 или jose
+    :return:
+    """
+    return CODECS[name.lower()]()
@@ -1,22 +1,90 @@
+import hashlib
 import time
+from dataclasses import dataclass
+from enum import Enum, unique
 from typing import Optional
 
-from jose import jwt, JWTError
-from pydantic import ValidationError
 from fastapi import Response, Request
 
-from config import load_config
-from models import schemas
+from src.config import ConfigWatcher, load_config
+from src.models import schemas
+from src.utils import TTLCache
+from .codec import get_codec, TokenDecodeError, TokenExpiredError
 
 config = load_config()
 
 
+@unique
+class TokenStatus(Enum):
+    ok = "ok"
+    expired = "expired"
+    invalid = "invalid"
+
+
+@dataclass
+class VerifiedToken:
+    """
+    Результат проверки токена
+
+    payload заполнен для валидного и для истекшего токена,
+    reason - для невалидного и истекшего
+    """
+    status: TokenStatus
+    payload: Optional[schemas.TokenPayload] = None
+    reason: Optional[str] = None
+
+    @property
+    def is_valid(self) -> bool:
+        return self.status == TokenStatus.ok
+
+
+class VerifiedTokens:
+    """
+    Токены из кук запроса
+
+    Каждый токен проверяется не более одного раза за запрос,
+    результат хранится в request.scope["jwt"]
+    """
+
+    def __init__(self, jwt_manager: "JWTManager", tokens: schemas.Tokens):
+        self._jwt = jwt_manager
+        self.tokens = tokens
+        self._access: Optional[VerifiedToken] = None
+        self._refresh: Optional[VerifiedToken] = None
+
+    @property
+    def access(self) -> VerifiedToken:
+        if self._access is None:
+            self._access = self._jwt.verify_access_token(self.tokens.access_token)
+        return self._access
+
+    @property
+    def refresh(self) -> VerifiedToken:
+        if self._refresh is None:
+            self._refresh = self._jwt.verify_refresh_token(self.tokens.refresh_token)
+        return self._refresh
+
+
 class JWTManager:
     ALGORITHM = "HS256"
-    ACCESS_TOKEN_EXPIRE_MINUTES = 30  # 30 minutes
+    CODEC = get_codec(config.base.jwt.CODEC)
+    # Компактные имена claims: поле TokenPayload -> ключ в токене
+    CLAIMS = {"id": "uid", "username": "usr", "role_id": "rol", "state_id": "sta", "exp": "exp"}
+    # Токены пока выпускаются с полными именами: воркеры предыдущего релиза
+    # читают только их. Читаются оба варианта, включить в следующем релизе
+    ISSUE_COMPACT_CLAIMS = False
+    _CLAIM_TYPES = {name: field.type_ for name, field in schemas.TokenPayload.__fields__.items()}
+    ACCESS_TOKEN_EXPIRE_MINUTES = config.base.jwt.ACCESS_TOKEN_EXPIRE_MINUTES  # 30 minutes by default
     REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
     JWT_ACCESS_SECRET_KEY = config.base.jwt.JWT_ACCESS_SECRET_KEY
     JWT_REFRESH_SECRET_KEY = config.base.jwt.JWT_REFRESH_SECRET_KEY
+    # Сессия проверяется только при обновлении токенов,
+    # время отзыва ограничено ACCESS_TOKEN_EXPIRE_MINUTES
+    IS_STATELESS = config.base.jwt.IS_STATELESS
+
+    # Кэш проверенных токенов, общий для всех экземпляров
+    TOKEN_CACHE_SIZE = 10000
+    token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
 
     COOKIE_EXP = 31536000
     COOKIE_PATH = "/api"
@@ -24,13 +92,69 @@ class JWTManager:
     COOKIE_ACCESS_KEY = "access_token"
     COOKIE_REFRESH_KEY = "refresh_token"
 
+    @classmethod
+    def reload_config(cls, old_config=None, new_config=None) -> None:
+        """
+        Применяет изменение config.base.jwt. Ключ кэша проверенных токенов
+        зависит от секрета, поэтому кэш не требует очистки
+        :param old_config:
+        :param new_config:
+        """
+        jwt_config = config.base.jwt
+        cls.CODEC = get_codec(jwt_config.CODEC)
+        cls.ACCESS_TOKEN_EXPIRE_MINUTES = jwt_config.ACCESS_TOKEN_EXPIRE_MINUTES
+        cls.JWT_ACCESS_SECRET_KEY = jwt_config.JWT_ACCESS_SECRET_KEY
+        cls.JWT_REFRESH_SECRET_KEY = jwt_config.JWT_REFRESH_SECRET_KEY
+        cls.IS_STATELESS = jwt_config.IS_STATELESS
+
+    def verify(self, token: str, secret_key: str) -> VerifiedToken:
+        """
+        Проверяет подпись и срок действия токена,
+        декодируя его ровно один раз
+        :param token:
+        :param secret_key:
+        :return: VerifiedToken
+        """
+        # Ключ зависит от секрета: после его смены старые записи не находятся
+        cache_key = hashlib.sha256(f"{secret_key}.{token}".encode("utf-8")).digest()
+        payload = self.token_cache.get(cache_key)
+        if payload is not None:
+            return VerifiedToken(status=TokenStatus.ok, payload=payload)
+
+        try:
+            payload = self._decode_jwt(token, secret_key)
+        except TokenDecodeError as ex:
+            return VerifiedToken(status=TokenStatus.invalid, reason=str(ex))
+
+        if payload.exp < int(time.time()):
+            return VerifiedToken(status=TokenStatus.expired, payload=payload, reason="Signature has expired.")
+        # Запись истекает вместе с токеном
+        self.token_cache.set(cache_key, payload, expire_at=payload.exp)
+        return VerifiedToken(status=TokenStatus.ok, payload=payload)
+
+    def verify_access_token(self, token: str) -> VerifiedToken:
+        """
+        Проверяет access-токен
+        :param token:
+        :return:
+        """
+        return self.verify(token, self.JWT_ACCESS_SECRET_KEY)
+
+    def verify_refresh_token(self, token: str) -> VerifiedToken:
+        """
+        Проверяет refresh-токен
+        :param token:
+        :return:
+        """
+        return self.verify(token, self.JWT_REFRESH_SECRET_KEY)
+
     def is_valid_refresh_token(self, token: str) -> bool:
         """
         Проверяет refresh-токен на валидность
         :param token:
         :return:
         """
-        return self._is_valid_jwt(token, self.JWT_REFRESH_SECRET_KEY)
+        return self.verify_refresh_token(token).is_valid
 
     def is_valid_access_token(self, token: str) -> bool:
         """
@@ -38,23 +162,25 @@ class JWTManager:
         :param token:
         :return:
         """
-        return self._is_valid_jwt(token, self.JWT_ACCESS_SECRET_KEY)
+        return self.verify_access_token(token).is_valid
 
     def decode_access_token(self, token: str) -> schemas.TokenPayload:
         """
         Декодирует access-токен (получает payload)
         :param token:
         :return:
+        :raises TokenDecodeError: токен невалиден, TokenExpiredError - истек
         """
-        return self._decode_jwt(token, self.JWT_ACCESS_SECRET_KEY)
+        return self._decode_unexpired_jwt(token, self.JWT_ACCESS_SECRET_KEY)
 
     def decode_refresh_token(self, token: str) -> schemas.TokenPayload:
         """
         Декодирует refresh-токен (получает payload)
         :param token:
         :return:
+        :raises TokenDecodeError: токен невалиден, TokenExpiredError - истек
         """
-        return self._decode_jwt(token, self.JWT_REFRESH_SECRET_KEY)
+        return self._decode_unexpired_jwt(token, self.JWT_REFRESH_SECRET_KEY)
 
     def generate_access_token(self, id: int, username: str, role_id: int, state_id: int, **kwargs) -> str:
         """
@@ -136,6 +262,22 @@ class JWTManager:
             return None
         return schemas.Tokens(access_token=access_token, refresh_token=refresh_token)
 
+    def get_verified_jwt_cookie(self, request: Request) -> Optional[VerifiedTokens]:
+        """
+        Получает из кук access и refresh-токены вместе с результатами
+        их проверки, общими для всего запроса
+        :param request:
+        :return:
+        """
+        verified = request.scope.get("jwt")
+        if verified is None:
+            tokens = self.get_jwt_cookie(request)
+            if not tokens:
+                return None
+            verified = VerifiedTokens(self, tokens)
+            request.scope["jwt"] = verified
+        return verified
+
     def delete_jwt_cookie(self, response: Response) -> None:
         """
         Удаляет из кук access и refresh-токены
@@ -145,18 +287,6 @@ class JWTManager:
         tokens = schemas.Tokens(access_token="", refresh_token="")
         self.set_jwt_cookie(response, tokens)
 
-    def _is_valid_jwt(self, token: str, secret_key: str) -> bool:
-        try:
-            payload = self._decode_jwt(token, secret_key)
-        except JWTError:
-            return False
-        except ValidationError:
-            return False
-
-        if payload.exp < int(time.time()):
-            return False
-        return True
-
     def _generate_token(
             self,
             user_id: int,
@@ -166,14 +296,35 @@ class JWTManager:
             exp_minutes: int,
             secret_key: str
     ) -> str:
-        payload = schemas.TokenPayload(
-            id=user_id,
-            username=username,
-            role_id=role_id,
-            state_id=state_id,
-            exp=int(time.time() + exp_minutes * 60)
-        )
-        return jwt.encode(payload.dict(), secret_key, self.ALGORITHM)
+        claims = {
+            "id": user_id,
+            "username": username,
+            "role_id": role_id,
+            "state_id": state_id,
+            "exp": int(time.time() + exp_minutes * 60),
+        }
+        if self.ISSUE_COMPACT_CLAIMS:
+            claims = {self.CLAIMS[name]: value for name, value in claims.items()}
+        return self.CODEC.encode(claims, secret_key)
+
+    def _decode_unexpired_jwt(self, token: str, secret_key: str) -> schemas.TokenPayload:
+        payload = self._decode_jwt(token, secret_key)
+        if payload.exp < int(time.time()):
+            raise TokenExpiredError("Signature has expired.")
+        return payload
 
     def _decode_jwt(self, token: str, secret_key: str) -> schemas.TokenPayload:
-        return schemas.TokenPayload.parse_obj(jwt.decode(token, secret_key, algorithms=[self.ALGORITHM]))
+        # Срок действия проверяется в verify, чтобы вернуть payload истекшего токена
+        claims = self.CODEC.decode(token, secret_key)
+        values = {}
+        for name, claim in self.CLAIMS.items():
+            # Полные имена - у токенов до перехода на компактные claims (см. ISSUE_COMPACT_CLAIMS)
+            value = claims.get(claim, claims.get(name))
+            if type(value) is not self._CLAIM_TYPES[name]:
+                raise TokenDecodeError(f"Invalid claim: {claim}")
+            values[name] = value
+        # Типы проверены выше, валидация pydantic не нужна
+        return schemas.TokenPayload.construct(**values)
+
+
+ConfigWatcher.subscribe("base.jwt", JWTManager.reload_config)
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+from typing import Dict, Optional
+
+from src.models import UserStates, schemas
+from src.services import repository
+from .jwt import JWTManager
+from .session import SessionManager
+
+
+class TokenRefresher:
+    """
+    Обновление (ротация) пары токенов по refresh-токену
+
+    Параллельные запросы с одним refresh-токеном объединяются:
+    ротация выполняется один раз, все ожидающие получают одну и ту же
+    новую пару. Замененный refresh-токен еще GRACE_PERIOD секунд
+    обменивается через redis на ту же пару, пока сессия хранит выданный
+    при ротации refresh-токен, пользователь активен и не изменился
+    с ротации. Результаты ротации удаляются вместе с сессией
+    """
+    GRACE_PERIOD = 30
+    REDIS_GRACE_PREFIX = "refresh_rotation:"
+
+    _in_flight: Dict[bytes, "asyncio.Task"] = {}
+
+    def __init__(
+            self,
+            jwt: JWTManager = JWTManager(),
+            session: SessionManager = SessionManager()
+    ):
+        self.jwt = jwt
+        self.session = session
+
+    async def refresh(
+            self,
+            session_id: Optional[int],
+            refresh_token: str,
+            user_id: int
+    ) -> Optional[schemas.RefreshedTokens]:
+        """
+        Выдает новую пару токенов для валидной сессии
+
+        :param session_id:
+        :param refresh_token: текущий (проверенный) refresh-токен
+        :param user_id: id из payload refresh-токена
+        :return: новые токены и их payload или None, если сессия недействительна
+            или пользователь не активен
+        """
+        key = hashlib.sha256(f"{session_id}.{refresh_token}".encode("utf-8")).digest()
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._rotate(key, session_id, refresh_token, user_id))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Отмена одного из ожидающих не должна прерывать ротацию для остальных
+        return await asyncio.shield(task)
+
+    async def _rotate(
+            self,
+            key: bytes,
+            session_id: Optional[int],
+            refresh_token: str,
+            user_id: int
+    ) -> Optional[schemas.RefreshedTokens]:
+        user = await repository.user.get_user_record(user_id)
+        if not user:
+            return None
+        # До ротации: сессия заблокированного пользователя не должна продлеваться.
+        # Не исключение: ротация идет внутри ленивой аутентификации, и что ответить,
+        # решает JWTCookie (в том числе с auto_error=False)
+        if UserStates(user.state_id) != UserStates.active:
+            return None
+
+        payload = schemas.TokenPayload(
+            id=user.id,
+            username=user.username,
+            role_id=user.role_id,
+            state_id=user.state_id,
+            exp=0
+        )  # exp не используется, но нужно для составления модели
+        refreshed = schemas.RefreshedTokens(
+            tokens=schemas.Tokens(
+                access_token=self.jwt.generate_access_token(**payload.dict()),
+                refresh_token=self.jwt.generate_refresh_token(**payload.dict())
+            ),
+            payload=payload
+        )
+        value = refreshed.json()
+
+        # Проверка сессии и ротация - один атомарный запрос к redis.
+        # Ключ результата в одном hash slot с сессией (для Redis Cluster)
+        grace_key = f"{{{session_id}}}:{self.REDIS_GRACE_PREFIX}{key.hex()}"
+        stored = await self.session.rotate_session(
+            session_id,
+            refresh_token,
+            refreshed.tokens.refresh_token,
+            grace_key=grace_key,
+            grace_value=value,
+            grace_exp=self.GRACE_PERIOD
+        )
+        if not stored:
+            return None
+        if stored == value:
+            return refreshed
+        # Токен уже заменен другим воркером. Пара выдана до изменения
+        # пользователя (роль, блокировка) - больше не выдается
+        replayed = schemas.RefreshedTokens.parse_raw(stored)
+        if replayed.payload != payload:
+            return None
+        return replayed
@@ -2,8 +2,8 @@ import uuid
 from typing import Optional
 
 from fastapi import Request, Response
-from config import load_config
-import utils
+from src.config import load_config
+from src import utils
 
 config = load_config()
 
@@ -15,6 +15,14 @@ class SessionManager:
     COOKIE_DOMAIN = None
     COOKIE_SESSION_KEY = "session_id"
 
+    # Локальный кэш сессий: session_id -> refresh-токен ("" - сессии нет).
+    # Изменения сессий рассылаются всем воркерам через redis pub/sub,
+    # CACHE_TTL ограничивает устаревание при гонке с рассылкой
+    CACHE_TTL = 5
+    CACHE_SIZE = 10000
+    INVALIDATION_CHANNEL = "session:invalidate"
+    cache = utils.TTLCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL)
+
     def __init__(self):
         if not utils.RedisClient.redis_client:
             utils.RedisClient.open_redis_client()
@@ -50,6 +58,17 @@ class SessionManager:
         """
         if not session_id:
             session_id = uuid.uuid4().int
+        self.set_session_cookie(response, session_id)
+        await self.save_session(session_id, refresh_token)
+        return session_id
+
+    def set_session_cookie(self, response: Response, session_id: int) -> None:
+        """
+        Устанавливает идентификатор сессии в куки
+
+        :param response:
+        :param session_id:
+        """
         response.set_cookie(
             key=self.COOKIE_SESSION_KEY,
             value=str(session_id),
@@ -59,8 +78,66 @@ class SessionManager:
             max_age=self.COOKIE_EXP,
             path=self.COOKIE_PATH
         )
-        await utils.RedisClient.set(str(session_id), refresh_token, expire=self.REDIS_EXP)
-        return session_id
+
+    async def save_session(self, session_id: int, refresh_token: str) -> None:
+        """
+        Сохраняет refresh-токен сессии в redis
+
+        :param session_id:
+        :param refresh_token:
+        """
+        key = str(session_id)
+        self.cache.pop(key)
+        # Один запрос к redis: SET ... EX и оповещение воркеров.
+        # Скрипт, в отличие от конвейера, работает и в режиме cluster
+        await utils.RedisClient.eval_script(
+            "save_session",
+            keys=[key],
+            args=[refresh_token, self.REDIS_EXP, self.INVALIDATION_CHANNEL, key]
+        )
+
+    async def rotate_session(
+            self,
+            session_id: int,
+            refresh_token: str,
+            new_refresh_token: str,
+            grace_key: str,
+            grace_value: str,
+            grace_exp: int
+    ) -> Optional[str]:
+        """
+        Атомарно заменяет refresh-токен сессии за один запрос к redis
+
+        Если по grace_key уже сохранен результат ротации этого токена,
+        возвращается он - только пока сессия хранит выданный при той
+        ротации refresh-токен. Иначе, если сессия хранит refresh_token,
+        он заменяется на new_refresh_token, а grace_value сохраняется
+        по grace_key на grace_exp секунд. grace_key должен быть в одном
+        hash slot с сессией: delete_session_id удаляет его вместе с ней
+
+        :param session_id:
+        :param refresh_token: текущий refresh-токен из кук
+        :param new_refresh_token:
+        :param grace_key: ключ результата ротации
+        :param grace_value: результат ротации
+        :param grace_exp:
+        :return: сохраненный результат ротации или None, если сессия недействительна
+        """
+        key = str(session_id)
+        self.cache.pop(key)
+        return await utils.RedisClient.eval_script(
+            "rotate_session",
+            keys=[key, grace_key, self.grace_index_key(session_id)],
+            args=[
+                refresh_token,
+                new_refresh_token,
+                self.REDIS_EXP,
+                grace_value,
+                grace_exp,
+                self.INVALIDATION_CHANNEL,
+                key
+            ]
+        )
 
     async def delete_session_id(self, session_id: int, response: Response) -> None:
         """
@@ -68,7 +145,21 @@ class SessionManager:
 
         :param
         """
-        await utils.RedisClient.delete(str(session_id))
+        key = str(session_id)
+        self.cache.pop(key)
+        await utils.RedisClient.eval_script(
+            "delete_session",
+            keys=[key, self.grace_index_key(session_id)],
+            args=[self.INVALIDATION_CHANNEL, key]
+        )
+        self.delete_session_cookie(response)
+
+    def delete_session_cookie(self, response: Response) -> None:
+        """
+        Удаляет сессию только из куков
+
+        :param response:
+        """
         response.delete_cookie(
             key=self.COOKIE_SESSION_KEY,
             secure=config.is_secure_cookie,
@@ -77,6 +168,11 @@ class SessionManager:
             path=self.COOKIE_PATH
         )
 
+    @staticmethod
+    def grace_index_key(session_id: int) -> str:
+        # Множество ключей результатов ротации сессии, в одном hash slot с ней
+        return f"{{{session_id}}}:refresh_rotations"
+
     async def is_valid_session(self, session_id: int, cookie_refresh_token: str) -> bool:
         """
         Проверяет валидность сессии
@@ -84,9 +180,76 @@ class SessionManager:
         :param cookie_refresh_token:
         :return: True or False
         """
-        redis_refresh_token = await utils.RedisClient.get(str(session_id))
+        redis_refresh_token = await self._get_refresh_token(session_id)
         if not redis_refresh_token:
             return False
         if redis_refresh_token != cookie_refresh_token:
             return False
         return True
+
+    async def _get_refresh_token(self, session_id: int) -> Optional[str]:
+        key = str(session_id)
+        # Без активной подписки об изменениях не узнать, кэш не используется
+        if not utils.RedisClient.is_listening:
+            return await utils.RedisClient.get(key)
+
+        refresh_token = self.cache.get(key)
+        if refresh_token is None:
+            refresh_token = await utils.RedisClient.get(key) or ""
+            self.cache.set(key, refresh_token)
+        return refresh_token
+
+    @classmethod
+    def _on_invalidate(cls, session_id: Optional[str]) -> None:
+        if session_id is None:
+            cls.cache.clear()
+        else:
+            cls.cache.pop(session_id)
+
+
+# KEYS: сессия, результат ротации, множество результатов ротации сессии
+# ARGV: текущий refresh-токен, новый refresh-токен, время жизни сессии,
+#       результат ротации, время его жизни, канал оповещения, id сессии
+ROTATE_SESSION_SCRIPT = """
+local rotated = redis.call('HMGET', KEYS[2], 'refresh_token', 'value')
+if rotated[2] then
+    -- После выхода, удаления сессии или следующей ротации результат недействителен
+    if redis.call('GET', KEYS[1]) == rotated[1] then
+        return rotated[2]
+    end
+    return false
+end
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return false
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+redis.call('HSET', KEYS[2], 'refresh_token', ARGV[2], 'value', ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+redis.call('SADD', KEYS[3], KEYS[2])
+redis.call('EXPIRE', KEYS[3], ARGV[5])
+redis.call('PUBLISH', ARGV[6], ARGV[7])
+return ARGV[4]
+"""
+
+# KEYS: сессия
+# ARGV: refresh-токен, время жизни сессии, канал оповещения, id сессии
+SAVE_SESSION_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+"""
+
+# KEYS: сессия, множество результатов ротации сессии
+# ARGV: канал оповещения, id сессии
+DELETE_SESSION_SCRIPT = """
+-- Результаты ротации в одном hash slot с сессией
+for _, rotated in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    redis.call('DEL', rotated)
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('PUBLISH', ARGV[1], ARGV[2])
+"""
+
+utils.RedisClient.register_script("rotate_session", ROTATE_SESSION_SCRIPT)
+utils.RedisClient.register_script("save_session", SAVE_SESSION_SCRIPT)
+utils.RedisClient.register_script("delete_session", DELETE_SESSION_SCRIPT)
+utils.RedisClient.subscribe(SessionManager.INVALIDATION_CHANNEL, SessionManager._on_invalidate)
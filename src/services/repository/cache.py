@@ -0,0 +1,154 @@
+import time
+from typing import Dict, Mapping, Optional, Sequence, Union
+
+from src.models import schemas
+from src import utils
+
+
+class UserCache:
+    """
+    Двухуровневый кэш пользователей по id: локальный LRU и redis
+
+    В redis хранится сериализованная schemas.User (без хеша пароля),
+    "" - пользователя нет (негативное кэширование). Изменения
+    пользователей рассылаются всем воркерам через redis pub/sub;
+    без активной подписки локальный уровень не используется.
+
+    После изменения в redis на TOMBSTONE_EXP секунд остается метка:
+    кэш заполняется через SET NX, поэтому чтение из БД, начатое
+    до изменения, не может вернуть в кэш устаревшую запись.
+    """
+
+    LOCAL_TTL = 30
+    LOCAL_SIZE = 10000
+    REDIS_EXP = 300
+    NEGATIVE_EXP = 30
+    TOMBSTONE = "-"
+    TOMBSTONE_EXP = 5
+    REDIS_PREFIX = "user:"
+    INVALIDATION_CHANNEL = "user:invalidate"
+    # id -> schemas.User или "" (пользователя нет)
+    local = utils.TTLCache(maxsize=LOCAL_SIZE, ttl=LOCAL_TTL)
+    redis_hits = 0
+    redis_misses = 0
+
+    @classmethod
+    async def get_many(cls, user_ids: Sequence[int]) -> Dict[int, Union[schemas.User, str]]:
+        """
+        Пользователи из кэша, недостающие в локальном уровне читаются из redis одним MGET
+
+        :param user_ids:
+        :return: id -> schemas.User или "" (пользователя нет); id, которых нет в кэше, отсутствуют
+        """
+        found = {}
+        missing = []
+        for user_id in user_ids:
+            user = cls.local.get(user_id) if utils.RedisClient.is_listening else None
+            if user is None:
+                missing.append(user_id)
+            else:
+                found[user_id] = user
+        if not missing:
+            return found
+
+        values = await utils.RedisClient.mget([cls.REDIS_PREFIX + str(user_id) for user_id in missing])
+        for user_id, value in zip(missing, values):
+            if value is None or value == cls.TOMBSTONE:
+                cls.redis_misses += 1
+                continue
+            cls.redis_hits += 1
+            user = schemas.User.parse_raw(value) if value else ""
+            cls._set_local(user_id, user)
+            found[user_id] = user
+        return found
+
+    @classmethod
+    async def set_many(cls, users: Mapping[int, Optional[schemas.User]]) -> None:
+        """
+        Сохраняет прочитанных из БД пользователей в оба уровня кэша,
+        если с тех пор их не успели изменить
+
+        :param users: id -> schemas.User, None - пользователя нет
+        """
+        if not users:
+            return
+        async with utils.RedisClient.pipeline(transaction=False) as pipe:
+            for user_id, user in users.items():
+                if user is None:
+                    pipe.set(cls.REDIS_PREFIX + str(user_id), "", ex=cls.NEGATIVE_EXP, nx=True)
+                else:
+                    pipe.set(cls.REDIS_PREFIX + str(user_id), user.json(), ex=cls.REDIS_EXP, nx=True)
+            results = await pipe.execute()
+        for (user_id, user), is_set in zip(users.items(), results):
+            if is_set:
+                cls._set_local(user_id, user or "")
+
+    @classmethod
+    async def invalidate(cls, user_id: int) -> None:
+        """
+        Удаляет пользователя из кэша всех воркеров
+
+        :param user_id:
+        """
+        cls.local.pop(user_id)
+        await utils.RedisClient.eval_script(
+            "invalidate_user",
+            keys=[cls.REDIS_PREFIX + str(user_id)],
+            args=[cls.TOMBSTONE, cls.TOMBSTONE_EXP, cls.INVALIDATION_CHANNEL, user_id]
+        )
+
+    @classmethod
+    async def invalidate_many(cls, user_ids: Sequence[int]) -> None:
+        """
+        Удаляет из кэша всех воркеров только что созданных пользователей
+        (например, при импорте) одним конвейером
+
+        :param user_ids:
+        """
+        if not user_ids:
+            return
+        for user_id in user_ids:
+            cls.local.pop(user_id)
+        async with utils.RedisClient.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.set(cls.REDIS_PREFIX + str(user_id), cls.TOMBSTONE, ex=cls.TOMBSTONE_EXP)
+            await pipe.execute()
+        # Одно оповещение на всех: в режиме cluster PUBLISH в конвейере недоступен
+        await utils.RedisClient.publish(cls.INVALIDATION_CHANNEL, ",".join(map(str, user_ids)))
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "local": cls.local.stats(),
+            "redis_hits": cls.redis_hits,
+            "redis_misses": cls.redis_misses,
+        }
+
+    @classmethod
+    def _set_local(cls, user_id: int, user) -> None:
+        if not utils.RedisClient.is_listening:
+            return
+        if user:
+            cls.local.set(user_id, user)
+        else:
+            cls.local.set(user_id, user, expire_at=time.time() + min(cls.NEGATIVE_EXP, cls.LOCAL_TTL))
+
+    @classmethod
+    def _on_invalidate(cls, user_ids: Optional[str]) -> None:
+        # Оповещение содержит один id или несколько через запятую (invalidate_many)
+        if user_ids is None:
+            cls.local.clear()
+        else:
+            for user_id in user_ids.split(","):
+                cls.local.pop(int(user_id))
+
+
+# KEYS: запись пользователя
+# ARGV: метка изменения, время ее жизни, канал оповещения, id пользователя
+INVALIDATE_USER_SCRIPT = """
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+redis.call('PUBLISH', ARGV[3], ARGV[4])
+"""
+
+utils.RedisClient.register_script("invalidate_user", INVALIDATE_USER_SCRIPT)
+utils.RedisClient.subscribe(UserCache.INVALIDATION_CHANNEL, UserCache._on_invalidate)
@@ -1,35 +1,368 @@
-from typing import List, Optional
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import asyncpg
+from tortoise import Tortoise
+from tortoise.exceptions import IntegrityError, OperationalError
 from tortoise.expressions import Q
 
 from src.models import tables
 from src.models import Role, A, M
 from src.models import UserStates
-from src.utils import get_hashed_password
+from src.models import schemas
+from src.utils import BatchLoader, PasswordHasher, PostgresClient, RedisClient
+from .cache import UserCache
+
+log = logging.getLogger(__name__)
+
+USER_INDEXES = {
+    # Уникальность username и email без учета регистра
+    "user_username_lower_key": 'CREATE UNIQUE INDEX IF NOT EXISTS "user_username_lower_key" ON "user" (lower("username"))',
+    "user_email_lower_key": 'CREATE UNIQUE INDEX IF NOT EXISTS "user_email_lower_key" ON "user" (lower("email"))',
+    # Keyset-пагинация списка пользователей
+    "user_create_time_id_idx": 'CREATE INDEX IF NOT EXISTS "user_create_time_id_idx" ON "user" ("create_time", "id")',
+}
+UNIQUE_FIELDS = ("username", "email")
+CHECK_INDEXES_SQL = """
+SELECT c."relname" FROM "pg_index" i JOIN "pg_class" c ON c."oid" = i."indexrelid"
+WHERE c."relname" = ANY($1) AND i."indisvalid" AND pg_table_is_visible(c."oid")
+"""
+
+
+# Колонки schemas.User, возвращаемые запросами через RETURNING
+USER_FIELDS = (
+    "id", "username", "email", "first_name", "last_name",
+    "role_id", "state_id", "create_time", "update_time"
+)
+USER_COLUMNS = ", ".join(f'"{column}"' for column in USER_FIELDS)
+SELECT_USERS_BY_IDS_SQL = f'SELECT {USER_COLUMNS} FROM "user" WHERE "id" = ANY($1)'
+SELECT_LOGIN_SQL = f'SELECT {USER_COLUMNS}, "hashed_password" FROM "user" WHERE "username" = $1'
+UPDATABLE_COLUMNS = {"username", "email", "first_name", "last_name", "role_id", "state_id"}
+
+DELETE_USER_SQL = f"""
+WITH updated AS (
+    UPDATE "user" SET "state_id" = $1, "update_time" = now() WHERE "id" = $2
+    RETURNING {USER_COLUMNS}
+), deleted AS (
+    INSERT INTO "user_deleted" ("id", "delete_time") SELECT "id", now() FROM updated
+    ON CONFLICT ("id") DO NOTHING
+)
+SELECT * FROM updated
+"""
+
+# Построчные данные импорта копируются в staging-таблицу через COPY,
+# затем вставляются одним запросом. Занятые username/email пропускаются
+# (ON CONFLICT DO NOTHING учитывает все уникальные индексы, включая lower()),
+# запрос возвращает номера строк и id вставленных пользователей (NULL - строка не принята)
+IMPORT_COLUMNS = ("line", "username", "email", "first_name", "last_name", "hashed_password")
+CREATE_IMPORT_TABLE_SQL = """
+CREATE TEMP TABLE "user_import" (
+    "line" INT NOT NULL,
+    "username" VARCHAR(30) NOT NULL,
+    "email" VARCHAR(100) NOT NULL,
+    "first_name" VARCHAR(50),
+    "last_name" VARCHAR(50),
+    "hashed_password" VARCHAR(255) NOT NULL
+) ON COMMIT DROP
+"""
+MERGE_IMPORT_SQL = """
+WITH inserted AS (
+    INSERT INTO "user" (
+        "username", "email", "first_name", "last_name",
+        "role_id", "state_id", "hashed_password", "create_time", "update_time"
+    )
+    SELECT "username", "email", "first_name", "last_name", $1, $2, "hashed_password", now(), now()
+    FROM "user_import" ORDER BY "line"
+    ON CONFLICT DO NOTHING
+    RETURNING "id", "username"
+)
+SELECT s."line", i."id" FROM "user_import" s
+LEFT JOIN inserted i ON i."username" = s."username"
+ORDER BY s."line"
+"""
+
+
+async def ensure_indexes() -> None:
+    """
+    Создает индексы, которые Tortoise не умеет описывать в модели.
+    Уникальность username и email без учета регистра проверяют только
+    эти индексы, поэтому без них приложение не стартует
+    """
+    connection = Tortoise.get_connection("default")
+    for name, sql in USER_INDEXES.items():
+        try:
+            await connection.execute_script(sql)
+        except (OperationalError, IntegrityError) as ex:
+            # Например, уже есть пользователи, отличающиеся только регистром
+            log.exception(f"Не удалось создать индекс {name}", exc_info=(type(ex), ex, ex.__traceback__))
+            raise
+    # IF NOT EXISTS пропускает и недействительный индекс (прерванный CREATE INDEX CONCURRENTLY)
+    await check_indexes()
+
+
+async def check_indexes() -> None:
+    """
+    Проверяет, что индексы USER_INDEXES созданы и действительны.
+    Без generate_schemas они создаются заранее, вместе со схемой
+
+    :raises RuntimeError: индексов нет или они недействительны
+    """
+    rows = await PostgresClient.fetch(CHECK_INDEXES_SQL, list(USER_INDEXES))
+    missing = sorted(set(USER_INDEXES) - {row["relname"] for row in rows})
+    if missing:
+        raise RuntimeError(f"Нет действительных индексов таблицы user: {', '.join(missing)}")
+
+
+def get_conflict_field(ex: IntegrityError) -> Optional[str]:
+    """
+    Поле, по которому вставка нарушила уникальность
+
+    :param ex:
+    :return: username, email или None
+    """
+    cause = ex.args[0] if ex.args else ex
+    # 23505 - unique_violation, остальные нарушения (например, NOT NULL) - не конфликт
+    if getattr(cause, "sqlstate", "23505") != "23505":
+        return None
+    # asyncpg сообщает имя ограничения, остальные драйверы - только текст ошибки
+    text = getattr(cause, "constraint_name", None) or str(cause)
+    for field in UNIQUE_FIELDS:
+        if field in text:
+            return field
+    return None
+
+
+async def get_user_record(user_id: int) -> Optional[schemas.User]:
+    """
+    Пользователь по id через кэш UserCache.
+    Одновременные вызовы объединяются в один запрос get_users_by_ids
+
+    :param user_id:
+    :return: запись пользователя без хеша пароля
+    """
+    return await user_loader.load(user_id)
+
+
+async def get_users_by_ids(user_ids: Sequence[int]) -> Dict[int, schemas.User]:
+    """
+    Пользователи по списку id: кэш, затем один запрос WHERE id = ANY($1)
+    для недостающих
+
+    :param user_ids:
+    :return: id -> запись пользователя, отсутствующие id не включаются
+    """
+    cached = await UserCache.get_many(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in cached]
+    if missing:
+        rows = await PostgresClient.fetch(SELECT_USERS_BY_IDS_SQL, missing, read=True, keys=missing)
+        loaded = {row["id"]: to_record(row) for row in rows}
+        await UserCache.set_many({user_id: loaded.get(user_id) for user_id in missing})
+        cached.update(loaded)
+    return {user_id: user for user_id, user in cached.items() if user}
+
+
+async def get_login_record(username: str) -> Optional[asyncpg.Record]:
+    """
+    Пользователь по username для входа, без построения модели ORM
+
+    Чтение идет на реплику. Если пользователя там нет (только что
+    зарегистрирован) или он недавно изменен, запись перечитывается
+    с основного сервера.
+
+    :param username:
+    :return: запись с колонками USER_COLUMNS и hashed_password или None
+    """
+    record = await PostgresClient.fetchrow(SELECT_LOGIN_SQL, username, read=True)
+    if PostgresClient.replica_names and (record is None or PostgresClient.is_recently_written([record["id"]])):
+        record = await PostgresClient.fetchrow(SELECT_LOGIN_SQL, username)
+    return record
+
+
+async def get_users_page(
+        limit: int,
+        after: Optional[Tuple[datetime, int]] = None,
+        state_id: Optional[int] = None,
+        role_id: Optional[int] = None
+) -> List[schemas.User]:
+    """
+    Страница пользователей, упорядоченных по (create_time, id)
+
+    Keyset-пагинация: следующая страница начинается после последней
+    записи предыдущей, поэтому стоимость запроса не растет с номером страницы
+
+    :param limit:
+    :param after: (create_time, id) последней записи предыдущей страницы
+    :param state_id:
+    :param role_id:
+    :return:
+    """
+    where, values = _user_filters(state_id=state_id, role_id=role_id)
+    if after is not None:
+        values.extend(after)
+        where.append(f'("create_time", "id") > (${len(values) - 1}, ${len(values)})')
+    values.append(limit)
+    sql = 'SELECT {0} FROM "user" {1} ORDER BY "create_time", "id" LIMIT ${2}'.format(
+        USER_COLUMNS, _where(where), len(values)
+    )
+    rows = await PostgresClient.fetch(sql, *values, read=True)
+    return [to_record(row) for row in rows]
 
 
-async def get_user(*args, **kwargs) -> Optional[tables.User]:
-    return await tables.User.filter(*args, **kwargs).first()
+async def iter_users(
+        state_id: Optional[int] = None,
+        role_id: Optional[int] = None,
+        prefetch: int = 1000
+) -> AsyncIterator[asyncpg.Record]:
+    """
+    Все пользователи через серверный курсор
 
+    Строки читаются порциями по prefetch, поэтому память не зависит
+    от количества пользователей. Соединение (реплики, если есть) занято
+    до конца обхода.
 
-async def get_users(*args, **kwargs) -> Optional[List[tables.User]]:
-    return await tables.User.filter(*args, **kwargs)
+    :param state_id:
+    :param role_id:
+    :param prefetch:
+    :return: записи с колонками USER_COLUMNS
+    """
+    where, values = _user_filters(state_id=state_id, role_id=role_id)
+    sql = 'SELECT {0} FROM "user" {1} ORDER BY "create_time", "id"'.format(USER_COLUMNS, _where(where))
+    async with PostgresClient.acquire(PostgresClient.get_read_connection_name()) as connection:
+        # Курсор существует только внутри транзакции
+        async with connection.transaction(readonly=True):
+            async for record in connection.cursor(sql, *values, prefetch=prefetch):
+                yield record
 
 
 async def create_user(**kwargs) -> tables.User:
-    return await tables.User.create(
+    user = await tables.User.create(
         role_id=Role(M.user, A.one).value(),
         state_id=UserStates.active.value,
-        hashed_password=get_hashed_password(kwargs.pop("password")),
+        hashed_password=await PasswordHasher.hash(kwargs.pop("password")),
         **kwargs
     )
+    # id мог быть закэширован как отсутствующий
+    await _written(user.id)
+    return user
 
 
-async def update_user(user_id: int, **kwargs) -> tables.User:
-    user = await tables.User.update_from_dict(await get_user(id=user_id), kwargs)
-    await user.save()
-    return user
+async def import_users(rows: Sequence[tuple]) -> List[int]:
+    """
+    Вставляет пользователей через COPY в staging-таблицу и один INSERT ... SELECT
+
+    Строки должны быть уникальны по username и email в пределах вызова.
+
+    :param rows: кортежи со значениями IMPORT_COLUMNS
+    :return: номера строк, не вставленных из-за занятых username или email
+    """
+    async with Tortoise.get_connection("default").acquire_connection() as connection:
+        async with connection.transaction():
+            await connection.execute(CREATE_IMPORT_TABLE_SQL)
+            await connection.copy_records_to_table("user_import", records=rows, columns=IMPORT_COLUMNS)
+            merged = await connection.fetch(
+                MERGE_IMPORT_SQL, Role(M.user, A.one).value(), UserStates.active.value
+            )
+    # Как в _written: id могли быть закэшированы как отсутствующие, реплики еще не получили строки
+    inserted = [record["id"] for record in merged if record["id"] is not None]
+    PostgresClient.mark_written(*inserted)
+    await UserCache.invalidate_many(inserted)
+    return [record["line"] for record in merged if record["id"] is None]
+
+
+async def update_user(user_id: int, **kwargs) -> Optional[schemas.User]:
+    """
+    Обновляет только переданные колонки одним UPDATE ... RETURNING
+
+    :param user_id:
+    :param kwargs: колонки из UPDATABLE_COLUMNS и их значения
+    :return: обновленная запись или None, если пользователя нет
+    """
+    unknown = set(kwargs) - UPDATABLE_COLUMNS
+    if unknown:
+        raise ValueError(f"Недопустимые поля пользователя: {', '.join(sorted(unknown))}")
+
+    columns = list(kwargs)
+    assignments = [f'"{column}" = ${number}' for number, column in enumerate(columns, start=1)]
+    assignments.append('"update_time" = now()')
+    sql = 'UPDATE "user" SET {0} WHERE "id" = ${1} RETURNING {2}'.format(
+        ", ".join(assignments), len(columns) + 1, USER_COLUMNS
+    )
+    rows = await Tortoise.get_connection("default").execute_query_dict(sql, [*kwargs.values(), user_id])
+    await _written(user_id)
+    return to_record(rows[0]) if rows else None
+
+
+async def update_password_hash(user_id: int, old_hash: str, new_hash: str) -> bool:
+    # Хеш заменяется, только если пароль не сменили с момента чтения
+    return bool(await tables.User.filter(id=user_id, hashed_password=old_hash).update(hashed_password=new_hash))
+
+
+async def delete(user_id: int) -> Optional[schemas.User]:
+    """
+    Помечает пользователя удаленным и добавляет запись в user_deleted
+    одним запросом (CTE выполняется атомарно)
+
+    :param user_id:
+    :return: обновленная запись или None, если пользователя нет
+    """
+    rows = await Tortoise.get_connection("default").execute_query_dict(
+        DELETE_USER_SQL, [UserStates.deleted.value, user_id]
+    )
+    await _written(user_id)
+    return to_record(rows[0]) if rows else None
+
+
+user_loader = BatchLoader(get_users_by_ids)
+
+
+async def _written(user_id: int) -> None:
+    """
+    Пользователь изменен: читать его с основного сервера, пока реплики
+    не догонят, и удалить из кэша всех воркеров. Другие воркеры узнают
+    об изменении из оповещения UserCache (_on_user_invalidated)
+    """
+    PostgresClient.mark_written(user_id)
+    await UserCache.invalidate(user_id)
+
+
+def _on_user_invalidated(user_ids: Optional[str]) -> None:
+    if user_ids is None:
+        # Оповещения могли быть потеряны
+        PostgresClient.mark_all_written()
+    else:
+        PostgresClient.mark_written(*(int(user_id) for user_id in user_ids.split(",")))
+
+
+def _user_filters(**filters) -> Tuple[List[str], list]:
+    where, values = [], []
+    for column, value in filters.items():
+        if value is not None:
+            values.append(value)
+            where.append(f'"{column}" = ${len(values)}')
+    return where, values
+
+
+def _where(conditions: List[str]) -> str:
+    return "WHERE " + " AND ".join(conditions) if conditions else ""
+
+
+def to_record(row: Mapping[str, Any]) -> schemas.User:
+    """
+    Запись пользователя из строки БД без проверки типов pydantic
+
+    :param row: строка с колонками USER_COLUMNS, лишние колонки (hashed_password) отбрасываются
+    :return:
+    """
+    values = {field: row[field] for field in USER_FIELDS}
+    return schemas.User.construct(full_name=_full_name(values), **values)
+
+
+def _full_name(values: Mapping[str, Any]) -> str:
+    # Как tables.User.full_name
+    if values["first_name"] or values["last_name"]:
+        return f"{values['first_name'] or ''} {values['last_name'] or ''}".strip()
+    return values["username"]
 
 
-async def delete(user_id: int) -> None:
-    await update_user(user_id, state_id=UserStates.deleted.value)
-    await tables.UserDeleted.create(id=user_id)
\ No newline at end of file
+RedisClient.subscribe(UserCache.INVALIDATION_CHANNEL, _on_user_invalidated)
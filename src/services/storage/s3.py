@@ -2,17 +2,41 @@ import random
 from contextlib import AsyncExitStack
 from typing import Optional, Union, IO
 
-from aioboto3 import session
-
 from .base import AbstractStorage, File, ContentType
 
-from aiobotocore.session import get_session, AioSession
-from config import load_config
+from src.config import load_config
 
 config = load_config()
 
 
 class S3(AbstractStorage):
+    # Общая сессия: описания сервисов botocore загружаются один раз, а не для каждого клиента
+    session = None
+
+    @classmethod
+    def get_session(cls):
+        if cls.session is None:
+            # aiobotocore импортируется долго и нужен только маршрутам /file
+            from aiobotocore.session import AioSession
+
+            cls.session = AioSession()
+        return cls.session
+
+    @classmethod
+    async def warmup(cls) -> None:
+        """
+        Импортирует aiobotocore и загружает описание сервиса в общую сессию,
+        создав и закрыв клиента по config.db.s3. Запросов к хранилищу не выполняется
+        """
+        async with cls(
+                bucket=config.db.s3.bucket,
+                service_name=config.db.s3.service_name,
+                endpoint_url=config.db.s3.endpoint_url,
+                region_name=config.db.s3.region_name,
+                aws_access_key_id=config.db.s3.aws_access_key_id,
+                aws_secret_access_key=config.db.s3.aws_secret_access_key
+        ):
+            pass
 
     def __init__(
             self,
@@ -37,9 +61,8 @@ class S3(AbstractStorage):
         self.client = None
 
     async def __aenter__(self):
-        session = AioSession()
         self.client = await self._exit_stack.enter_async_context(
-            session.create_client(
+            self.get_session().create_client(
                 aws_secret_access_key=self.aws_secret_access_key,
                 aws_access_key_id=self.aws_access_key_id,
                 region_name=self.region_name,
@@ -0,0 +1,170 @@
+import asyncio
+import csv
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Set, Tuple
+
+from src import utils
+from src.utils import validators
+from src.services import repository
+from src.views import ImportReportResponse, ImportRowError
+
+
+class UserImporter:
+    """
+    Массовый импорт пользователей из CSV или NDJSON
+
+    Загруженный файл Starlette уже целиком сохранил (SpooledTemporaryFile),
+    он читается порциями по BATCH_SIZE строк. Чтение и проверка строк
+    правилами utils.validators выполняются в пуле потоков, чтобы не
+    занимать event loop, пароли хешируются в пуле процессов порциями
+    по HASH_CHUNK_SIZE, каждая порция загружается через COPY
+    (repository.user.import_users). Ошибки возвращаются построчно.
+    """
+
+    BATCH_SIZE = 5000
+    HASH_CHUNK_SIZE = 250
+    MAX_REPORTED_ERRORS = 1000
+    FIELDS = ("username", "email", "password", "first_name", "last_name")
+    # Размеры колонок tables.User
+    MAX_LENGTHS = {"email": 100, "first_name": 50, "last_name": 50}
+
+    executor: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        if cls.executor is None:
+            cls.executor = ProcessPoolExecutor(max_workers=utils.PasswordHasher.MAX_WORKERS)
+        return cls.executor
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False, cancel_futures=True)
+            cls.executor = None
+
+    @classmethod
+    async def import_file(cls, file: BinaryIO, format: str) -> ImportReportResponse:
+        """
+        Импортирует пользователей из файла
+
+        :param file: файл в utf-8
+        :param format: csv (с заголовком) или ndjson
+        :return: отчет об импорте
+        """
+        start = time.perf_counter()
+        report = ImportReportResponse(total=0, imported=0, failed=0, errors=[], rows_per_second=0)
+        # username и email в нижнем регистре, уже встреченные в файле
+        seen: Tuple[Set[str], Set[str]] = (set(), set())
+        rows = cls._read_rows(file, format)
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await loop.run_in_executor(None, cls._read_batch, rows, seen, report)
+            if not batch:
+                break
+            await cls._import_batch(batch, report)
+
+        report.errors.sort(key=lambda error: error.line)
+        elapsed = time.perf_counter() - start
+        report.rows_per_second = report.imported / elapsed if elapsed else 0
+        return report
+
+    @classmethod
+    async def _import_batch(cls, batch: List[Tuple[int, dict]], report: ImportReportResponse) -> None:
+        passwords = [row["password"] for _, row in batch]
+        loop = asyncio.get_running_loop()
+        chunks = await asyncio.gather(*(
+            loop.run_in_executor(
+                cls.get_executor(),
+                utils.password.hash_passwords,
+                passwords[start:start + cls.HASH_CHUNK_SIZE],
+                utils.PasswordHasher.ALGORITHM,
+                utils.PasswordHasher.params
+            )
+            for start in range(0, len(passwords), cls.HASH_CHUNK_SIZE)
+        ))
+        hashes = [hashed for chunk in chunks for hashed in chunk]
+
+        rejected = await repository.user.import_users([
+            (line, row["username"], row["email"], row.get("first_name"), row.get("last_name"), hashed)
+            for (line, row), hashed in zip(batch, hashes)
+        ])
+        for line in rejected:
+            cls._add_error(report, line, "username или email уже зарегистрирован")
+        report.imported += len(batch) - len(rejected)
+
+    @classmethod
+    def _read_batch(
+            cls,
+            rows: Iterator[Tuple[int, object]],
+            seen: Tuple[Set[str], Set[str]],
+            report: ImportReportResponse
+    ) -> List[Tuple[int, dict]]:
+        """Следующие BATCH_SIZE прошедших проверку строк, ошибки записываются в report"""
+        batch = []
+        for line, row in rows:
+            report.total += 1
+            error = cls._validate(row, seen) if isinstance(row, dict) else row
+            if error:
+                cls._add_error(report, line, error)
+                continue
+            batch.append((line, row))
+            if len(batch) >= cls.BATCH_SIZE:
+                break
+        return batch
+
+    @classmethod
+    def _read_rows(cls, file: BinaryIO, format: str) -> Iterator[Tuple[int, object]]:
+        """Строки файла: (номер строки, dict) или (номер строки, текст ошибки)"""
+        text = io.TextIOWrapper(file, encoding="utf-8", newline="")
+        if format == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+            return
+
+        for line, raw in enumerate(text, start=1):
+            if not raw.strip():
+                continue
+            try:
+                row = json.loads(raw)
+            except ValueError:
+                yield line, "некорректный JSON"
+                continue
+            yield line, row if isinstance(row, dict) else "строка должна быть JSON-объектом"
+
+    @classmethod
+    def _validate(cls, row: dict, seen: Tuple[Set[str], Set[str]]) -> Optional[str]:
+        for field in cls.FIELDS[:3]:
+            if not isinstance(row.get(field), str):
+                return f"не указан {field}"
+        for field in cls.FIELDS[3:]:
+            if row.get(field) is not None and not isinstance(row[field], str):
+                return f"некорректный {field}"
+            if row.get(field) == "":
+                row[field] = None
+        if not validators.is_valid_username(row["username"]):
+            return "некорректный username"
+        if not validators.is_valid_email(row["email"]):
+            return "некорректный email"
+        if not validators.is_valid_password(row["password"]):
+            return "некорректный password"
+        for field, max_length in cls.MAX_LENGTHS.items():
+            if row.get(field) and len(row[field]) > max_length:
+                return f"{field} длиннее {max_length} символов"
+
+        usernames, emails = seen
+        username, email = row["username"].lower(), row["email"].lower()
+        if username in usernames or email in emails:
+            return "username или email повторяется в файле"
+        usernames.add(username)
+        emails.add(email)
+        return None
+
+    @classmethod
+    def _add_error(cls, report: ImportReportResponse, line: int, error: str) -> None:
+        report.failed += 1
+        if len(report.errors) < cls.MAX_REPORTED_ERRORS:
+            report.errors.append(ImportRowError(line=line, error=error))
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import FastAPI
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import ValidationError
+from pydantic.fields import SHAPE_SINGLETON
+
+from src import utils
+from src.config import load_config
+from src.services import repository
+from src.services.storage.s3 import S3
+
+config = load_config()
+
+
+class WarmupManager:
+    """
+    Прогрев воркера при старте
+
+    Пока идет прогрев, воркер принимает соединения, но /ready отвечает 503,
+    и балансировщик не направляет на него трафик. Прогреваются:
+    - postgres: пулы основного сервера и реплик, горячие запросы
+      в кэше подготовленных запросов каждого соединения;
+    - redis: соединения пула и Lua-скрипты на сервере;
+    - s3: импорт aiobotocore и описание сервиса в общей сессии;
+    - openapi: схема, которую иначе строит первый запрос /docs;
+    - serializers: проверка и кодирование ответов маршрутов с response_model.
+
+    Ошибка шага записывается в steps и не мешает остальным: непрогретое
+    прогреется на первых запросах. Через config.base.warmup.TIMEOUT
+    воркер объявляется готовым, даже если прогрев не закончен.
+    """
+
+    log: logging.Logger = logging.getLogger(__name__)
+    task: Optional[asyncio.Task] = None
+    ready: bool = False
+    # Шаг -> {"ms": длительность} или {"error": текст ошибки}
+    steps: Dict[str, dict] = {}
+    duration_ms: Optional[float] = None
+
+    @classmethod
+    def start(cls, app: FastAPI) -> None:
+        """
+        Запускает прогрев в фоне, без прогрева воркер сразу готов
+
+        :param app:
+        """
+        cls.steps = {}
+        cls.duration_ms = None
+        if not config.base.warmup.ENABLED:
+            cls.ready = True
+            return
+        cls.ready = False
+        cls.task = asyncio.create_task(cls.run(app))
+
+    @classmethod
+    async def stop(cls) -> None:
+        """
+        Снимает готовность и отменяет незаконченный прогрев
+        """
+        cls.ready = False
+        if cls.task:
+            cls.task.cancel()
+            try:
+                await cls.task
+            except asyncio.CancelledError:
+                pass
+            cls.task = None
+
+    @classmethod
+    async def run(cls, app: FastAPI) -> None:
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(cls._run_steps(app), config.base.warmup.TIMEOUT)
+        except asyncio.TimeoutError:
+            cls.log.warning(f"Прогрев не закончился за {config.base.warmup.TIMEOUT} с, воркер объявлен готовым")
+        cls.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        cls.ready = True
+        cls.log.info(f"Прогрев завершен за {cls.duration_ms} мс: {cls.steps}")
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "ready": cls.ready,
+            "duration_ms": cls.duration_ms,
+            "steps": cls.steps,
+        }
+
+    @classmethod
+    async def _run_steps(cls, app: FastAPI) -> None:
+        warmup_config = config.base.warmup
+        # Сетевые шаги независимы и идут одновременно
+        steps = [
+            cls._step("postgres", lambda: utils.PostgresClient.warmup(
+                warmup_config.DB_CONNECTIONS,
+                [
+                    (repository.user.SELECT_LOGIN_SQL, [""]),
+                    (repository.user.SELECT_USERS_BY_IDS_SQL, [[]]),
+                ]
+            )),
+        ]
+        if config.db.redis:
+            steps.append(cls._step("redis", lambda: utils.RedisClient.warmup(warmup_config.REDIS_CONNECTIONS)))
+        if config.db.s3 and config.db.s3.endpoint_url:
+            steps.append(cls._step("s3", S3.warmup))
+        await asyncio.gather(*steps)
+
+        await cls._step("openapi", lambda: cls._openapi(app))
+        await cls._step("serializers", lambda: cls._serializers(app))
+
+    @classmethod
+    async def _step(cls, name: str, warmup: Callable[[], Awaitable]) -> None:
+        start = time.perf_counter()
+        try:
+            await warmup()
+        except Exception as ex:
+            cls.steps[name] = {"error": repr(ex)}
+            cls.log.exception(f"Шаг прогрева {name} завершен с исключением", exc_info=(type(ex), ex, ex.__traceback__))
+            return
+        cls.steps[name] = {"ms": round((time.perf_counter() - start) * 1000, 1)}
+
+    @classmethod
+    async def _openapi(cls, app: FastAPI) -> None:
+        app.openapi()
+
+    @classmethod
+    async def _serializers(cls, app: FastAPI) -> None:
+        """
+        Пропускает запись пользователя через проверку и кодирование ответа
+        каждого маршрута так же, как FastAPI. Маршруты, ответ которых строится
+        не из пользователя, пропускаются
+        """
+        now = datetime.now()
+        user = repository.user.to_record({
+            "id": 0, "username": "warmup", "email": "warmup@localhost", "first_name": "warmup",
+            "last_name": None, "role_id": 0, "state_id": 0, "create_time": now, "update_time": now,
+        })
+        for route in app.routes:
+            if not isinstance(route, APIRoute) or route.response_field is None:
+                continue
+            try:
+                await serialize_response(
+                    field=route.response_field,
+                    response_content=user if route.response_field.shape == SHAPE_SINGLETON else [user],
+                    include=route.response_model_include,
+                    exclude=route.response_model_exclude,
+                    by_alias=route.response_model_by_alias,
+                    exclude_unset=route.response_model_exclude_unset,
+                    exclude_defaults=route.response_model_exclude_defaults,
+                    exclude_none=route.response_model_exclude_none,
+                )
+            except ValidationError:
+                pass
@@ -1,6 +1,9 @@
 from .redis import RedisClient
+from .postgres import PostgresClient
 from .aiohttp_client import AiohttpClient
 from . import formators
 from . import validators
-from .password import get_hashed_password, verify_password
+from .password import get_hashed_password, verify_password, PasswordHasher, PasswordHasherOverloaded
 from . import other
+from .cache import TTLCache
+from .loader import BatchLoader
@@ -0,0 +1,79 @@
+"""In-process cache utility."""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache(object):
+    """LRU-кэш ограниченного размера со сроком жизни записей.
+     Предназначен для использования внутри одного event loop и не
+     является потокобезопасным.
+    Attributes:
+        maxsize (int): Максимальное количество записей, при превышении
+            вытесняется давно не использованная запись.
+        ttl (float, optional): Время жизни записи в секундах по умолчанию.
+        hits (int): Количество попаданий.
+        misses (int): Количество промахов (включая истекшие записи).
+        evictions (int): Количество записей, вытесненных по размеру.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Возвращает значение по ключу или default,
+         если записи нет или ее срок жизни истек.
+        """
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expire_at, value = item
+        if expire_at is not None and expire_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expire_at: Optional[float] = None) -> None:
+        """Сохраняет значение.
+        Args:
+            key: Ключ.
+            value: Значение.
+            expire_at (float, optional): Unix-время истечения записи,
+                по умолчанию - текущее время + ttl.
+        """
+        if expire_at is None and self.ttl is not None:
+            expire_at = time.time() + self.ttl
+        if expire_at is not None and expire_at <= time.time():
+            return
+        self._data[key] = (expire_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
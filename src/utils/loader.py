@@ -0,0 +1,83 @@
+"""Request coalescing utility."""
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Mapping, Optional, Sequence, Set, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """Объединение запросов по ключам (по образцу DataLoader).
+     Ключи, запрошенные через load в одной итерации event loop,
+     загружаются одним вызовом batch_fn. Одинаковые ключи
+     загружаются один раз. Если batch_fn завершился ошибкой, ключи
+     пакета загружаются по одному, и ошибку получают только ожидающие
+     ключа, на котором она повторилась.
+    Attributes:
+        batch_fn (callable): Загружает значения по списку ключей и возвращает
+            словарь ключ -> значение; отсутствующие ключи получают None.
+        max_batch_size (int): Максимальное количество ключей в одном вызове batch_fn.
+        batches (int): Количество вызовов batch_fn.
+        loads (int): Количество вызовов load.
+    """
+
+    def __init__(
+            self,
+            batch_fn: Callable[[List[K]], Awaitable[Mapping[K, V]]],
+            max_batch_size: int = 100
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.batches = 0
+        self.loads = 0
+        self._pending: Dict[K, asyncio.Future] = {}
+        # Ссылки на задачи загрузки, чтобы их не собрал сборщик мусора
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def load(self, key: K) -> Optional[V]:
+        """Загружает значение по ключу вместе с другими ключами этой итерации."""
+        self.loads += 1
+        future = self._pending.get(key)
+        if future is None:
+            if not self._pending:
+                asyncio.get_running_loop().call_soon(self._dispatch)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+        # Отмена одного из ожидающих не должна отменять загрузку для остальных
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Sequence[K]) -> List[Optional[V]]:
+        """Загружает значения по ключам, сохраняя порядок."""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def stats(self) -> dict:
+        return {
+            "loads": self.loads,
+            "batches": self.batches,
+        }
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = {key: pending[key] for key in keys[start:start + self.max_batch_size]}
+            task = asyncio.ensure_future(self._load_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch: Dict[K, asyncio.Future]) -> None:
+        self.batches += 1
+        try:
+            values = await self.batch_fn(list(batch))
+        except Exception as ex:
+            if len(batch) > 1:
+                # Один неверный ключ не должен ломать загрузку остальных ключей пакета
+                await asyncio.gather(*(self._load_batch({key: future}) for key, future in batch.items()))
+                return
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(ex)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(values.get(key))
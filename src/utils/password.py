@@ -1,33 +1,378 @@
+import asyncio
+import base64
 import hashlib
-import random
+import hmac
+import logging
+import os
+import re
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
 
+from src.config import load_config
 from .other import int_to_bytes
 
+config = load_config()
+log = logging.getLogger(__name__)
+T = TypeVar("T")
 
-def get_hashed_password(password: str) -> str:
+
+# Формат хеша: $<алгоритм>$<параметры k=v,...>$<соль base64>$<хеш base64>
+# (по образцу PHC string format). Старый формат - 5 цифр соли и hex PBKDF2-SHA256
+# с 50000 итерациями - распознается при проверке.
+PBKDF2 = "pbkdf2-sha256"
+SCRYPT = "scrypt"
+ARGON2 = "argon2id"
+LEGACY = "legacy"
+# parse_hash для поврежденного хеша или хеша неизвестного алгоритма
+MALFORMED = "malformed"
+LEGACY_FORMAT = re.compile(r"\d{5}[0-9a-f]{64}")
+
+DEFAULT_PARAMS: Dict[str, Dict[str, int]] = {
+    PBKDF2: {"i": 600000},
+    SCRYPT: {"n": 2 ** 15, "r": 8, "p": 1},
+    ARGON2: {"m": 19456, "t": 2, "p": 1},
+}
+# Калибровка не опускает стоимость ниже этих значений
+# (для PBKDF2-SHA256 - рекомендация OWASP)
+MIN_PARAMS: Dict[str, Dict[str, int]] = {
+    PBKDF2: {"i": 600000},
+    SCRYPT: {"n": 2 ** 14, "r": 8, "p": 1},
+    ARGON2: {"m": 19456, "t": 1, "p": 1},
+}
+LEGACY_PARAMS = {"i": 50000}
+SCRYPT_MAX_N = 2 ** 17
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+
+def get_hashed_password(password: str, scheme: str = PBKDF2, params: Optional[Dict[str, int]] = None) -> str:
     """
     Генерирует хеш пароля со случайной солью
-    Соль состоит из 5 символов и записывается
-    справа от хеша. Хеш, в свою очередь, записывается
-    в хекс-формате.
 
-    :param password: soult + hashed_pass str
-    :return:
+    Алгоритм и параметры записываются в саму строку хеша,
+    поэтому их можно менять, не ломая уже сохраненные пароли.
+
+    :param password:
+    :param scheme: pbkdf2-sha256, scrypt или argon2id
+    :param params: параметры стоимости алгоритма, по умолчанию DEFAULT_PARAMS
+    :return: $scheme$params$salt$hash str
+    """
+    params = params or DEFAULT_PARAMS[scheme]
+    salt = os.urandom(SALT_SIZE)
+    digest = _derive(password, scheme, params, salt)
+    return "${0}${1}${2}${3}".format(
+        scheme,
+        ",".join(f"{key}={value}" for key, value in params.items()),
+        _b64encode(salt),
+        _b64encode(digest)
+    )
+
+
+def hash_passwords(passwords: Sequence[str], scheme: str = PBKDF2, params: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Хеши нескольких паролей за один вызов: при вычислении в пуле процессов
+    пароли передаются порциями, а не по одному
+
+    :param passwords:
+    :param scheme:
+    :param params:
+    :return: хеши в порядке паролей
     """
-    salt = random.randint(10000, 19000)
-    hashed_pass = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), int_to_bytes(salt), 50000, dklen=32).hex()
-    storage = str(salt) + hashed_pass
-    return storage
+    return [get_hashed_password(password, scheme, params) for password in passwords]
 
 
 def verify_password(password: str, storage: str) -> bool:
     """
     Проверяет пароль на валидность
     :param password:
-    :param storage: salt + hashed_pass str from db
+    :param storage: хеш из db в новом или старом формате
+    :return: False и для поврежденного хеша
+    """
+    if not storage.startswith("$"):
+        if not LEGACY_FORMAT.fullmatch(storage):
+            log.warning("Сохраненный хеш пароля поврежден")
+            return False
+        salt = int(storage[:5])
+        hashed_pass_from_storage = storage[5:]
+        new_hash_pass = hashlib.pbkdf2_hmac(
+            'sha256', password.encode('utf-8'), int_to_bytes(salt), LEGACY_PARAMS["i"], dklen=32
+        ).hex()
+        return hmac.compare_digest(new_hash_pass, hashed_pass_from_storage)
+
+    parts = _split_hash(storage)
+    if parts is None:
+        log.warning("Сохраненный хеш пароля поврежден или вычислен неизвестным алгоритмом")
+        return False
+    scheme, params, salt, digest = parts
+    new_digest = _derive(password, scheme, params, salt, len(digest))
+    return hmac.compare_digest(new_digest, digest)
+
+
+def parse_hash(storage: str) -> Tuple[str, Dict[str, int]]:
+    """
+    Алгоритм и параметры сохраненного хеша
+
+    :param storage:
+    :return: (scheme, params), для старого формата - ("legacy", {"i": 50000}),
+        для поврежденного хеша - ("malformed", {})
+    """
+    if not storage.startswith("$"):
+        if not LEGACY_FORMAT.fullmatch(storage):
+            return MALFORMED, {}
+        return LEGACY, dict(LEGACY_PARAMS)
+    parts = _split_hash(storage)
+    if parts is None:
+        return MALFORMED, {}
+    scheme, params, _, _ = parts
+    return scheme, params
+
+
+def hash_cost(scheme: str, params: Dict[str, int]) -> int:
+    """Относительная стоимость вычисления хеша в пределах одного алгоритма"""
+    if scheme == SCRYPT:
+        return params["n"] * params["r"] * params["p"]
+    if scheme == ARGON2:
+        return params["m"] * params["t"]
+    return params["i"]
+
+
+def needs_rehash(storage: str, scheme: str, params: Dict[str, int], tolerance: float = 0.25) -> bool:
+    """
+    Нужно ли пересчитать хеш под текущие алгоритм и параметры
+
+    Стоимость, подобранная калибровкой, немного отличается между
+    воркерами, поэтому параметры считаются совпадающими, пока
+    стоимость отличается не больше чем на tolerance.
+
+    :param storage:
+    :param scheme: текущий алгоритм
+    :param params: текущие параметры
+    :param tolerance:
     :return:
     """
-    salt = int(storage[:5])
-    hashed_pass_from_storage = storage[5:]
-    new_hash_pass = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), int_to_bytes(salt), 50000, dklen=32).hex()
-    return new_hash_pass == hashed_pass_from_storage
+    stored_scheme, stored_params = parse_hash(storage)
+    if stored_scheme != scheme:
+        return True
+    stored_cost = hash_cost(scheme, stored_params)
+    target_cost = hash_cost(scheme, params)
+    return abs(stored_cost - target_cost) > target_cost * tolerance
+
+
+def calibrate(scheme: str, target_ms: float) -> Dict[str, int]:
+    """
+    Подбирает параметры, при которых вычисление одного хеша
+    на текущем оборудовании занимает около target_ms миллисекунд
+
+    :param scheme:
+    :param target_ms:
+    :return: параметры не ниже MIN_PARAMS
+    """
+    params = dict(MIN_PARAMS[scheme])
+    target = target_ms / 1000
+    if scheme == PBKDF2:
+        elapsed = _measure(scheme, params)
+        iterations = int(params["i"] * target / elapsed)
+        params["i"] = max(MIN_PARAMS[scheme]["i"], iterations // 1000 * 1000)
+    elif scheme == SCRYPT:
+        # Память растет вместе с n, поэтому n ограничено SCRYPT_MAX_N
+        while params["n"] < SCRYPT_MAX_N and _measure(scheme, params) * 2 <= target:
+            params["n"] *= 2
+    elif scheme == ARGON2:
+        elapsed = _measure(scheme, params)
+        params["t"] = max(MIN_PARAMS[scheme]["t"], round(params["t"] * target / elapsed))
+    return params
+
+
+def _derive(password: str, scheme: str, params: Dict[str, int], salt: bytes, size: int = HASH_SIZE) -> bytes:
+    secret = password.encode("utf-8")
+    if scheme == PBKDF2:
+        return hashlib.pbkdf2_hmac("sha256", secret, salt, params["i"], dklen=size)
+    if scheme == SCRYPT:
+        return hashlib.scrypt(
+            secret,
+            salt=salt,
+            n=params["n"],
+            r=params["r"],
+            p=params["p"],
+            maxmem=256 * params["n"] * params["r"] * params["p"],
+            dklen=size
+        )
+    if scheme == ARGON2:
+        # Необязательная зависимость: pip install argon2-cffi
+        from argon2.low_level import Type, hash_secret_raw
+        return hash_secret_raw(
+            secret,
+            salt,
+            time_cost=params["t"],
+            memory_cost=params["m"],
+            parallelism=params["p"],
+            hash_len=size,
+            type=Type.ID
+        )
+    raise ValueError(f"Неизвестный алгоритм хеширования пароля: {scheme}")
+
+
+def _measure(scheme: str, params: Dict[str, int], rounds: int = 3) -> float:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        _derive("calibration", scheme, params, b"\0" * SALT_SIZE)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _split_hash(storage: str) -> Optional[Tuple[str, Dict[str, int], bytes, bytes]]:
+    """
+    Разбирает хеш нового формата
+
+    :param storage:
+    :return: (scheme, params, salt, digest) или None, если хеш поврежден
+        или алгоритм неизвестен
+    """
+    parts = storage.split("$")
+    if len(parts) != 5 or parts[0] or parts[1] not in DEFAULT_PARAMS:
+        return None
+    _, scheme, params, salt, digest = parts
+    try:
+        params = _parse_params(params)
+        salt, digest = _b64decode(salt), _b64decode(digest)
+    except ValueError:
+        return None
+    if params.keys() != DEFAULT_PARAMS[scheme].keys() or min(params.values()) <= 0 or not digest:
+        return None
+    return scheme, params, salt, digest
+
+
+def _parse_params(params: str) -> Dict[str, int]:
+    return {key: int(value) for key, value in (item.split("=") for item in params.split(","))}
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    # binascii.Error - подкласс ValueError
+    return base64.b64decode(data + "=" * (-len(data) % 4), validate=True)
+
+
+class PasswordHasherOverloaded(Exception):
+    """Очередь вычисления хешей паролей переполнена"""
+
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"Очередь хеширования паролей переполнена, повторите через {retry_after} с")
+
+
+class PasswordHasher:
+    """
+    Вычисление хешей паролей вне event loop
+
+    PBKDF2 занимает десятки миллисекунд процессорного времени и,
+    выполняясь прямо в обработчике, останавливает все остальные запросы.
+    Хеши вычисляются в пуле потоков (hashlib освобождает GIL на время
+    PBKDF2) или процессов. Число одновременно вычисляемых и ожидающих
+    хешей ограничено MAX_PENDING: сверх него запрос сразу получает
+    PasswordHasherOverloaded, а не ждет в общей очереди.
+
+    Новые хеши вычисляются алгоритмом ALGORITHM с параметрами params,
+    которые calibrate подбирает при старте под TARGET_MS.
+    """
+
+    EXECUTOR: str = config.base.password.EXECUTOR
+    MAX_WORKERS: int = config.base.password.MAX_WORKERS
+    MAX_PENDING: int = config.base.password.MAX_PENDING
+    RETRY_AFTER: int = config.base.password.RETRY_AFTER
+    ALGORITHM: str = config.base.password.ALGORITHM
+    TARGET_MS: int = config.base.password.TARGET_MS
+
+    params: Dict[str, int] = dict(DEFAULT_PARAMS[ALGORITHM])
+
+    executor: Optional[Executor] = None
+    pending: int = 0
+    rejected: int = 0
+
+    @classmethod
+    def get_executor(cls) -> Executor:
+        if cls.executor is None:
+            if cls.EXECUTOR == "process":
+                cls.executor = ProcessPoolExecutor(max_workers=cls.MAX_WORKERS)
+            else:
+                cls.executor = ThreadPoolExecutor(max_workers=cls.MAX_WORKERS, thread_name_prefix="password")
+        return cls.executor
+
+    @classmethod
+    def shutdown(cls) -> None:
+        if cls.executor is not None:
+            cls.executor.shutdown(wait=False, cancel_futures=True)
+            cls.executor = None
+
+    @classmethod
+    async def calibrate(cls) -> None:
+        """
+        Подбирает params под TARGET_MS на текущем оборудовании, 0 - оставить по умолчанию
+
+        Замеры занимают сотни миллисекунд, поэтому выполняются в пуле, а не в event loop
+        """
+        if cls.TARGET_MS <= 0:
+            return
+        cls.params = await asyncio.get_running_loop().run_in_executor(
+            cls.get_executor(), calibrate, cls.ALGORITHM, cls.TARGET_MS
+        )
+        log.info(f"Параметры хеширования паролей {cls.ALGORITHM}: {cls.params}")
+
+    @classmethod
+    def needs_rehash(cls, storage: str) -> bool:
+        """
+        Хеш вычислен другим алгоритмом или с другой стоимостью
+
+        :param storage: хеш из db
+        :return:
+        """
+        return needs_rehash(storage, cls.ALGORITHM, cls.params)
+
+    @classmethod
+    async def hash(cls, password: str) -> str:
+        """
+        Асинхронный get_hashed_password с текущими алгоритмом и параметрами
+
+        :param password:
+        :return: $scheme$params$salt$hash str
+        """
+        return await cls._run(get_hashed_password, password, cls.ALGORITHM, cls.params)
+
+    @classmethod
+    async def verify(cls, password: str, storage: str) -> bool:
+        """
+        Асинхронный verify_password
+
+        :param password:
+        :param storage: хеш из db
+        :return:
+        """
+        return await cls._run(verify_password, password, storage)
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            "executor": cls.EXECUTOR,
+            "algorithm": cls.ALGORITHM,
+            "params": cls.params,
+            "max_workers": cls.MAX_WORKERS,
+            "max_pending": cls.MAX_PENDING,
+            "pending": cls.pending,
+            "rejected": cls.rejected,
+        }
+
+    @classmethod
+    async def _run(cls, func: Callable[..., T], *args) -> T:
+        if cls.pending >= cls.MAX_PENDING:
+            cls.rejected += 1
+            raise PasswordHasherOverloaded(cls.RETRY_AFTER)
+
+        cls.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(cls.get_executor(), func, *args)
+        finally:
+            cls.pending -= 1
@@ -0,0 +1,459 @@
+"""Postgres pool class utility."""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple, TypeVar
+)
+
+import asyncpg
+from tortoise import Tortoise
+from tortoise.backends.asyncpg.client import AsyncpgDBClient as BaseAsyncpgDBClient
+from tortoise.backends.base.client import BaseDBAsyncClient, PoolConnectionWrapper
+from tortoise.backends.base.config_generator import expand_db_url
+from tortoise.exceptions import DBConnectionError
+from src.config import load_config
+from .cache import TTLCache
+
+config = load_config()
+
+T = TypeVar("T")
+
+# Ошибки, после которых чтение с реплики повторяется на основном сервере
+REPLICA_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.InterfaceError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    DBConnectionError,
+)
+
+# Позиция WAL основного сервера на момент проверки реплик
+PRIMARY_LSN_SQL = "SELECT pg_current_wal_lsn()"
+
+# Отставание реплики в секундах. Реплика, применившая WAL основного сервера
+# до позиции $1, не отстает, даже если на нем давно не было записи.
+# Совпадение полученной и примененной позиций самой реплики этого
+# не доказывает: реплика с оборванным приемом WAL перестает получать
+# изменения. Иначе отставание - время с последней примененной транзакции,
+# NULL (реплика недоступна для чтения), если она неизвестна
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_replay_lsn() >= $1::pg_lsn THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END::float8
+"""
+
+
+class PostgresClient(object):
+    """Определение утилиты Postgres.
+     Служебный класс для настройки пула соединений Tortoise и быстрых
+     запросов к нему напрямую через asyncpg, минуя построение запросов ORM.
+     Запросы выполняются через кэш подготовленных запросов asyncpg:
+     повторный запрос на том же соединении не разбирается и не планируется заново.
+
+     Реплики из config.db.postgresql.replicas подключаются как отдельные
+     соединения Tortoise. Чтения распределяются по репликам с отставанием
+     не больше max_replica_lag, отставание проверяет фоновая задача.
+     Ключи (например, id пользователей), измененные за последние
+     read_your_writes_window секунд, читаются с основного сервера.
+    Attributes:
+        ENGINE (str): Модуль движка Tortoise с клиентом, замеряющим ожидание соединения.
+        CONNECTION_NAME (str): Имя соединения Tortoise с основным сервером.
+        REPLICA_PREFIX (str): Префикс имен соединений Tortoise с репликами.
+        LATENCY_WINDOW (int): Сколько последних ожиданий соединения учитывается в перцентилях.
+        log (logging.Logger): Обработчик ведения журнала для этого класса.
+        replica_names (list): Имена соединений с репликами.
+        replica_lag (dict): Последнее измеренное отставание реплик в секундах,
+            None - реплика недоступна или еще не проверена.
+        replica_index (int): Индекс последней выбранной реплики.
+        recent_writes (TTLCache): Недавно измененные ключи.
+        primary_until (float): До этого момента все чтения идут на основной сервер.
+        monitor_task (asyncio.Task, optional): Задача проверки отставания реплик.
+        primary_reads (int): Количество чтений с основного сервера.
+        replica_reads (int): Количество чтений с реплик.
+        replica_errors (int): Количество чтений, повторенных на основном сервере из-за ошибки реплики.
+        acquires (int): Количество полученных из пула соединений.
+        acquire_timeouts (int): Количество неудачных ожиданий соединения.
+        acquire_time_total (float): Суммарное время ожидания соединения, в секундах.
+        acquire_time_max (float): Наибольшее время ожидания соединения, в секундах.
+        acquire_times (deque): Последние LATENCY_WINDOW ожиданий соединения, в секундах.
+    """
+
+    ENGINE: str = "src.utils.postgres"
+    CONNECTION_NAME: str = "default"
+    REPLICA_PREFIX: str = "replica_"
+    LATENCY_WINDOW: int = 1000
+    log: logging.Logger = logging.getLogger(__name__)
+    replica_names: List[str] = []
+    replica_lag: Dict[str, Optional[float]] = {}
+    replica_index: int = -1
+    recent_writes: TTLCache = TTLCache(maxsize=100000, ttl=config.db.postgresql.read_your_writes_window)
+    primary_until: float = 0.0
+    monitor_task: Optional[asyncio.Task] = None
+    primary_reads: int = 0
+    replica_reads: int = 0
+    replica_errors: int = 0
+    acquires: int = 0
+    acquire_timeouts: int = 0
+    acquire_time_total: float = 0.0
+    acquire_time_max: float = 0.0
+    acquire_times: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    @classmethod
+    def tortoise_config(cls, modules: Dict[str, Iterable[str]]) -> dict:
+        """Конфигурация Tortoise с параметрами пула из config.db.postgresql.
+        Args:
+            modules (dict): Модули моделей по именам приложений.
+        Returns:
+            dict: Значение аргумента config для register_tortoise.
+        """
+        postgres_config = config.db.postgresql
+        pool_credentials = {
+            "minsize": postgres_config.min_size,
+            "maxsize": postgres_config.max_size,
+            "statement_cache_size": postgres_config.statement_cache_size,
+            "command_timeout": postgres_config.command_timeout or None,
+            "max_inactive_connection_lifetime": postgres_config.max_inactive_connection_lifetime,
+        }
+        connections = {
+            cls.CONNECTION_NAME: {
+                "engine": cls.ENGINE,
+                "credentials": {
+                    "host": postgres_config.host,
+                    "port": postgres_config.port,
+                    "user": postgres_config.username,
+                    "password": postgres_config.password,
+                    "database": postgres_config.database,
+                    **pool_credentials,
+                },
+            },
+        }
+        dsns = [dsn.strip() for dsn in (postgres_config.replicas or "").split(",") if dsn.strip()]
+        cls.replica_names = [f"{cls.REPLICA_PREFIX}{index}" for index in range(len(dsns))]
+        cls.replica_lag = {name: None for name in cls.replica_names}
+        for name, dsn in zip(cls.replica_names, dsns):
+            credentials = expand_db_url(dsn)["credentials"]
+            credentials.update(pool_credentials)
+            connections[name] = {"engine": cls.ENGINE, "credentials": credentials}
+        return {
+            "connections": connections,
+            "apps": {
+                name: {"models": list(models), "default_connection": cls.CONNECTION_NAME}
+                for name, models in modules.items()
+            },
+        }
+
+    @classmethod
+    def get_pool(cls, name: Optional[str] = None) -> Optional[asyncpg.Pool]:
+        """Пул соединений Tortoise, None - до инициализации Tortoise или первого запроса."""
+        if not Tortoise._inited:
+            return None
+        return Tortoise.get_connection(name or cls.CONNECTION_NAME)._pool
+
+    @classmethod
+    def get_connection(cls, name: Optional[str] = None) -> BaseDBAsyncClient:
+        """Соединение Tortoise по имени, по умолчанию - основной сервер."""
+        return Tortoise.get_connection(name or cls.CONNECTION_NAME)
+
+    @classmethod
+    def get_read_connection_name(cls, keys: Iterable[Hashable] = ()) -> str:
+        """Выбирает соединение для чтения.
+         Основной сервер выбирается, если среди keys есть недавно измененные,
+         если реплик нет или все они отстают больше max_replica_lag.
+         Иначе реплики перебираются по кругу.
+        Args:
+            keys (iterable): Ключи читаемых записей.
+        Returns:
+            str: Имя соединения Tortoise.
+        """
+        if not cls.replica_names or cls.is_recently_written(keys):
+            return cls.CONNECTION_NAME
+        max_lag = config.db.postgresql.max_replica_lag
+        for _ in cls.replica_names:
+            cls.replica_index = (cls.replica_index + 1) % len(cls.replica_names)
+            name = cls.replica_names[cls.replica_index]
+            lag = cls.replica_lag.get(name)
+            if lag is not None and lag <= max_lag:
+                return name
+        return cls.CONNECTION_NAME
+
+    @classmethod
+    def mark_written(cls, *keys: Hashable) -> None:
+        """Следующие read_your_writes_window секунд ключи читаются с основного сервера."""
+        for key in keys:
+            cls.recent_writes.set(key, True)
+
+    @classmethod
+    def mark_all_written(cls) -> None:
+        """Следующие read_your_writes_window секунд все чтения идут на основной сервер.
+         Используется, когда оповещения об изменениях могли быть потеряны.
+        """
+        cls.primary_until = time.time() + config.db.postgresql.read_your_writes_window
+
+    @classmethod
+    def is_recently_written(cls, keys: Iterable[Hashable] = ()) -> bool:
+        if cls.primary_until > time.time():
+            return True
+        return any(cls.recent_writes.get(key) for key in keys)
+
+    @classmethod
+    async def acquire_from(cls, pool: asyncpg.Pool) -> asyncpg.Connection:
+        """Получает соединение из пула, замеряя время ожидания.
+         Ждет не дольше config.db.postgresql.acquire_timeout.
+        Args:
+            pool (asyncpg.Pool): Пул соединений.
+        Returns:
+            asyncpg.Connection: Соединение, которое нужно вернуть через pool.release.
+        Raises:
+            asyncio.TimeoutError: Свободное соединение не появилось вовремя.
+        """
+        start = time.perf_counter()
+        try:
+            connection = await pool.acquire(timeout=config.db.postgresql.acquire_timeout)
+        except asyncio.TimeoutError:
+            cls.acquire_timeouts += 1
+            cls.log.warning("Не дождались свободного соединения с Postgres.")
+            raise
+        elapsed = time.perf_counter() - start
+        cls.acquires += 1
+        cls.acquire_time_total += elapsed
+        cls.acquire_time_max = max(cls.acquire_time_max, elapsed)
+        cls.acquire_times.append(elapsed)
+        return connection
+
+    @classmethod
+    @asynccontextmanager
+    async def acquire(cls, name: Optional[str] = None) -> AsyncIterator[asyncpg.Connection]:
+        """Соединение из пула Tortoise на время блока async with.
+        Args:
+            name (str, optional): Имя соединения Tortoise, по умолчанию - основной сервер.
+        """
+        async with cls.get_connection(name).acquire_connection() as connection:
+            yield connection
+
+    @classmethod
+    async def fetch(cls, sql: str, *args, read: bool = False, keys: Iterable[Hashable] = ()) -> List[asyncpg.Record]:
+        """Выполнить запрос через подготовленный запрос и вернуть все строки.
+        Args:
+            sql (str): Запрос с параметрами $1, $2, ...
+            *args: Значения параметров.
+            read (bool): Запрос только читает данные и может выполняться на реплике.
+            keys (iterable): Ключи читаемых записей для get_read_connection_name.
+        Returns:
+            list: Строки asyncpg.Record.
+        """
+        return await cls._execute(lambda connection: connection.fetch(sql, *args), read, keys)
+
+    @classmethod
+    async def fetchrow(
+            cls, sql: str, *args, read: bool = False, keys: Iterable[Hashable] = ()
+    ) -> Optional[asyncpg.Record]:
+        """Выполнить запрос через подготовленный запрос и вернуть первую строку.
+        Args:
+            sql (str): Запрос с параметрами $1, $2, ...
+            *args: Значения параметров.
+            read (bool): Запрос только читает данные и может выполняться на реплике.
+            keys (iterable): Ключи читаемых записей для get_read_connection_name.
+        Returns:
+            asyncpg.Record, optional: Первая строка или None.
+        """
+        return await cls._execute(lambda connection: connection.fetchrow(sql, *args), read, keys)
+
+    @classmethod
+    async def warmup(cls, connections: int, statements: Iterable[Tuple[str, Sequence[Any]]] = ()) -> Dict[str, int]:
+        """Открывает соединения основного сервера и реплик до первых запросов.
+         Пулы Tortoise создаются при первом запросе, поэтому без прогрева
+         его ждет первый запрос к каждому серверу. В каждом пуле одновременно
+         занимается до connections соединений (не больше max_size), и на каждом
+         выполняются statements, чтобы они попали в кэш подготовленных запросов.
+        Args:
+            connections (int): Сколько соединений открыть в каждом пуле.
+            statements (iterable): Только читающие запросы и значения их параметров.
+        Returns:
+            dict: Имя соединения Tortoise -> количество прогретых соединений.
+                Недоступные реплики пропускаются.
+        Raises:
+            OSError, asyncpg.PostgresError: Основной сервер недоступен.
+        """
+        statements = list(statements)
+        warmed = {}
+        for name in [cls.CONNECTION_NAME, *cls.replica_names]:
+            try:
+                warmed[name] = await cls._warmup_pool(name, connections, statements)
+            except REPLICA_ERRORS as ex:
+                if name == cls.CONNECTION_NAME:
+                    raise
+                cls.log.warning(f"Реплика Postgres {name} не прогрета: {ex!r}")
+        return warmed
+
+    @classmethod
+    async def check_replicas(cls) -> None:
+        """Измеряет отставание реплик, недоступные реплики получают отставание None."""
+        try:
+            async with cls.acquire() as connection:
+                primary_lsn = await connection.fetchval(
+                    PRIMARY_LSN_SQL, timeout=config.db.postgresql.replica_check_interval
+                )
+        except REPLICA_ERRORS as ex:
+            # Без позиции основного сервера отставание оценивается по времени
+            cls.log.warning(f"Не удалось получить позицию WAL основного сервера Postgres: {ex!r}")
+            primary_lsn = None
+        for name in cls.replica_names:
+            try:
+                async with cls.acquire(name) as connection:
+                    cls.replica_lag[name] = await connection.fetchval(
+                        REPLICA_LAG_SQL, primary_lsn, timeout=config.db.postgresql.replica_check_interval
+                    )
+            except REPLICA_ERRORS as ex:
+                if cls.replica_lag.get(name) is not None:
+                    cls.log.warning(f"Реплика Postgres {name} недоступна: {ex!r}")
+                cls.replica_lag[name] = None
+
+    @classmethod
+    def start_replica_monitor(cls) -> None:
+        """Запускает задачу проверки отставания реплик."""
+        if cls.monitor_task is None and cls.replica_names:
+            cls.monitor_task = asyncio.create_task(cls._monitor_replicas())
+
+    @classmethod
+    async def stop_replica_monitor(cls) -> None:
+        """Останавливает задачу проверки отставания реплик."""
+        if cls.monitor_task:
+            cls.monitor_task.cancel()
+            try:
+                await cls.monitor_task
+            except asyncio.CancelledError:
+                pass
+            cls.monitor_task = None
+        cls.replica_lag = {name: None for name in cls.replica_names}
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """Метрики пулов соединений.
+        Returns:
+            dict: Для основного сервера и каждой реплики - границы размера пула,
+                количество открытых, занятых и свободных соединений, число
+                ожидающих соединения запросов, для реплик - отставание.
+                Общие для всех пулов время ожидания соединения в миллисекундах
+                и распределение чтений.
+        """
+        if cls.get_pool() is None:
+            return {}
+
+        times = sorted(cls.acquire_times)
+        return {
+            **cls._pool_stats(cls.get_pool()),
+            "replicas": {
+                name: {**cls._pool_stats(cls.get_pool(name)), "lag": cls.replica_lag.get(name)}
+                for name in cls.replica_names
+            },
+            "primary_reads": cls.primary_reads,
+            "replica_reads": cls.replica_reads,
+            "replica_errors": cls.replica_errors,
+            "acquires": cls.acquires,
+            "acquire_timeouts": cls.acquire_timeouts,
+            "acquire_ms": {
+                "avg": cls.acquire_time_total / cls.acquires * 1000 if cls.acquires else 0.0,
+                "p50": times[len(times) // 2] * 1000 if times else 0.0,
+                "p99": times[max(int(len(times) * 0.99) - 1, 0)] * 1000 if times else 0.0,
+                "max": cls.acquire_time_max * 1000,
+            },
+        }
+
+    @classmethod
+    def _pool_stats(cls, pool: Optional[asyncpg.Pool]) -> dict:
+        if pool is None:
+            return {}
+        size = pool.get_size()
+        idle = pool.get_idle_size()
+        return {
+            "min_size": pool.get_min_size(),
+            "max_size": pool.get_max_size(),
+            "size": size,
+            "in_use": size - idle,
+            "idle": idle,
+            # Запросы, ждущие в очереди пула свободное соединение
+            "waiting": len(pool._queue._getters),
+        }
+
+    @classmethod
+    async def _execute(
+            cls,
+            query: Callable[[asyncpg.Connection], Awaitable[T]],
+            read: bool,
+            keys: Iterable[Hashable]
+    ) -> T:
+        name = cls.get_read_connection_name(keys) if read else cls.CONNECTION_NAME
+        if name != cls.CONNECTION_NAME:
+            try:
+                async with cls.acquire(name) as connection:
+                    result = await query(connection)
+                cls.replica_reads += 1
+                return result
+            except REPLICA_ERRORS as ex:
+                # Реплика исключается до следующей проверки, запрос повторяется на основном сервере
+                cls.replica_errors += 1
+                cls.replica_lag[name] = None
+                cls.log.warning(f"Ошибка чтения с реплики Postgres {name}: {ex!r}")
+        if read:
+            cls.primary_reads += 1
+        async with cls.acquire() as connection:
+            return await query(connection)
+
+    @classmethod
+    async def _warmup_pool(cls, name: str, connections: int, statements: List[Tuple[str, Sequence[Any]]]) -> int:
+        wrapper = cls.get_connection(name).acquire_connection()
+        await wrapper.ensure_connection()
+        pool = wrapper.pool
+        # Соединения занимаются одновременно, иначе пул отдавал бы одно и то же
+        acquired = await asyncio.gather(
+            *(
+                pool.acquire(timeout=config.db.postgresql.acquire_timeout)
+                for _ in range(min(connections, pool.get_max_size()))
+            ),
+            return_exceptions=True,
+        )
+        opened = [connection for connection in acquired if not isinstance(connection, BaseException)]
+        try:
+            for result in acquired:
+                if isinstance(result, BaseException):
+                    raise result
+            for sql, args in statements:
+                await asyncio.gather(*(connection.fetch(sql, *args) for connection in opened))
+        finally:
+            await asyncio.gather(*(pool.release(connection) for connection in opened))
+        return len(opened)
+
+    @classmethod
+    async def _monitor_replicas(cls) -> None:
+        while True:
+            try:
+                await cls.check_replicas()
+            except Exception as ex:
+                cls.log.exception("Ошибка проверки реплик Postgres", exc_info=(type(ex), ex, ex.__traceback__))
+            await asyncio.sleep(config.db.postgresql.replica_check_interval)
+
+
+class TimedPoolConnectionWrapper(PoolConnectionWrapper):
+    """Получение соединения из пула Tortoise с замером ожидания в PostgresClient."""
+
+    async def __aenter__(self):
+        await self.ensure_connection()
+        self.connection = await PostgresClient.acquire_from(self.pool)
+        return self.connection
+
+
+class AsyncpgDBClient(BaseAsyncpgDBClient):
+    """Клиент Tortoise для asyncpg, соединения которого учитываются в PostgresClient.pool_stats."""
+
+    def acquire_connection(self) -> TimedPoolConnectionWrapper:
+        return TimedPoolConnectionWrapper(self)
+
+
+# Модуль служит движком Tortoise (PostgresClient.ENGINE)
+client_class = AsyncpgDBClient
@@ -1,63 +1,120 @@
 """Redis client class utility."""
+import asyncio
+import hashlib
 import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Union
 
 import aioredis
 import aioredis.sentinel
-from aioredis.exceptions import RedisError
-from config import load_config
+import redis.exceptions
+from aioredis.client import Pipeline, PubSub
+from aioredis.exceptions import NoScriptError, RedisError
+from redis.asyncio.cluster import ClusterNode, RedisCluster
+from src.config import ConfigWatcher, load_config
 
 config = load_config()
 
+# Клиент Redis Cluster (пакет redis) бросает собственные исключения
+REDIS_ERRORS = (RedisError, redis.exceptions.RedisError)
+NO_SCRIPT_ERRORS = (NoScriptError, redis.exceptions.NoScriptError)
+
 
 class RedisClient(object):
     """Определение утилиты Redis.
      Служебный класс для обработки подключения к базе данных Redis и операций.
     Attributes:
-        redis_client (aioredis.Redis, optional): Экземпляр клиентского объекта Redis.
+        redis_client (aioredis.Redis | RedisCluster, optional): Экземпляр клиентского объекта Redis.
+        pubsub_client (aioredis.Redis, optional): Клиент подписки на каналы, без socket_timeout.
         log (logging.Logger): Обработчик ведения журнала для этого класса.
         base_redis_init_kwargs (dict): Общие kwargs независимо от других Redis
             конфигурациях.
         connection_kwargs (dict, optional): Дополнительные kwargs для инициализации
             объекта Redis.
+        subscriptions (dict): Обработчики сообщений pub/sub по каналам.
+        listener_task (asyncio.Task, optional): Задача, читающая сообщения pub/sub.
+        is_listening (bool): Подписка активна и сообщения доставляются.
+        scripts (dict): Зарегистрированные Lua-скрипты: имя -> (исходный код, SHA1).
     """
 
-    redis_client: aioredis.Redis = None
+    redis_client: Union[aioredis.Redis, RedisCluster] = None
+    pubsub_client: Optional[aioredis.Redis] = None
     log: logging.Logger = logging.getLogger(__name__)
     base_redis_init_kwargs: dict = {
         "encoding": "utf-8",
         "decode_responses": True,
-        "port": config.db.redis.port,
     }
     connection_kwargs: dict = {}
+    subscriptions: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+    listener_task: Optional[asyncio.Task] = None
+    is_listening: bool = False
+    LISTENER_RETRY_DELAY: float = 1.0
+    # Сколько ждать завершения запросов на замененном клиенте перед его закрытием
+    DRAIN_TIMEOUT: float = 30.0
+    DRAIN_POLL_INTERVAL: float = 0.05
+    pubsub_node_index: int = -1
+    scripts: Dict[str, Tuple[str, str]] = {}
 
     @classmethod
     def open_redis_client(cls):
         """Создает экземпляр объекта сеанса клиента Redis.
-         В зависимости от конфигурации создает клиент Redis или Redis Sentinel.
+         В зависимости от config.db.redis.mode создает клиент Redis (single),
+         клиент мастера Redis Sentinel (sentinel) или клиент Redis Cluster (cluster).
+         Размер пула, таймауты и проверка соединений берутся из конфигурации.
         Returns:
-            aioredis.Redis: Экземпляр объекта Redis.
+            aioredis.Redis | redis.asyncio.cluster.RedisCluster: Экземпляр клиента.
         """
         if cls.redis_client is None:
-            cls.log.debug("Инициализация клиента Redis.")
+            redis_config = config.db.redis
+            cls.log.debug(f"Инициализация клиента Redis ({redis_config.mode}).")
 
-            if config.db.redis.username:
-                cls.connection_kwargs.update({"username": config.db.redis.username})
-            if config.db.redis.password:
-                cls.connection_kwargs.update({"password": config.db.redis.password})
+            if redis_config.username:
+                cls.connection_kwargs.update({"username": redis_config.username})
+            if redis_config.password:
+                cls.connection_kwargs.update({"password": redis_config.password})
+            cls.base_redis_init_kwargs.update(cls.connection_kwargs)
 
-            # if redis_conf.REDIS_USE_SENTINEL:
-            #     sentinel = aioredis.sentinel.Sentinel(
-            #         [(redis_conf.REDIS_HOST, redis_conf.REDIS_PORT)],
-            #         sentinel_kwargs=cls.connection_kwargs,
-            #     )
-            #     cls.redis_client = sentinel.master_for("mymaster")
-            # else:
+            pool_kwargs = {
+                "max_connections": redis_config.max_connections,
+                "socket_timeout": redis_config.socket_timeout,
+                "socket_connect_timeout": redis_config.socket_connect_timeout,
+                "health_check_interval": redis_config.health_check_interval,
+            }
 
-            cls.base_redis_init_kwargs.update(cls.connection_kwargs)
-            cls.redis_client = aioredis.from_url(
-                "redis://{0:s}/0".format(config.db.redis.host),
-                **cls.base_redis_init_kwargs,
-            )
+            if redis_config.mode == "sentinel":
+                sentinel = aioredis.sentinel.Sentinel(
+                    cls._nodes(),
+                    sentinel_kwargs={
+                        "socket_timeout": redis_config.socket_timeout,
+                        "socket_connect_timeout": redis_config.socket_connect_timeout,
+                    },
+                    **cls.base_redis_init_kwargs,
+                )
+                cls.redis_client = sentinel.master_for(
+                    redis_config.sentinel_master,
+                    db=redis_config.db,
+                    retry_on_timeout=redis_config.retry_on_timeout,
+                    **pool_kwargs,
+                )
+            elif redis_config.mode == "cluster":
+                cls.redis_client = RedisCluster(
+                    startup_nodes=[ClusterNode(host, port) for host, port in cls._nodes()],
+                    retry_on_error=[redis.exceptions.TimeoutError] if redis_config.retry_on_timeout else None,
+                    **pool_kwargs,
+                    **cls.base_redis_init_kwargs,
+                )
+            else:
+                # При исчерпании пула запрос ждет освободившееся соединение
+                # до pool_timeout секунд вместо немедленной ошибки
+                connection_pool = aioredis.BlockingConnectionPool.from_url(
+                    "redis://{0:s}/{1:d}".format(redis_config.host, redis_config.db),
+                    port=redis_config.port,
+                    timeout=redis_config.pool_timeout,
+                    retry_on_timeout=redis_config.retry_on_timeout,
+                    **pool_kwargs,
+                    **cls.base_redis_init_kwargs,
+                )
+                cls.redis_client = aioredis.Redis(connection_pool=connection_pool)
         return cls.redis_client
 
     @classmethod
@@ -65,7 +122,141 @@ class RedisClient(object):
         """Завершение клиента Redis."""
         if cls.redis_client:
             cls.log.debug("Завершение клиента Redis.")
-            await cls.redis_client.close()
+            await cls._close_client(cls.redis_client)
+            cls.redis_client = None
+        if cls.pubsub_client:
+            await cls.pubsub_client.close()
+            cls.pubsub_client = None
+
+    @classmethod
+    async def reload_redis_client(cls, old_config=None, new_config=None):
+        """Пересоздает клиент Redis после изменения config.db.redis.
+         Новый клиент создается до закрытия старого, поэтому запросы
+         не остаются без клиента, а старый закрывается, когда завершатся
+         начатые на нем запросы. Подписка pub/sub переоткрывается
+         на новом клиенте.
+        Args:
+            old_config (RedisConfig, optional): Прежний раздел конфигурации.
+            new_config (RedisConfig, optional): Новый раздел конфигурации.
+        """
+        if cls.redis_client is None:
+            return
+        cls.log.info("Пересоздание клиента Redis после изменения конфигурации.")
+        was_listening = cls.listener_task is not None
+        if was_listening:
+            await cls.stop_listener()
+        old_client, old_pubsub_client = cls.redis_client, cls.pubsub_client
+        cls.redis_client = None
+        cls.pubsub_client = None
+        # Учетные данные берутся из новой конфигурации
+        cls.connection_kwargs = {}
+        cls.base_redis_init_kwargs.pop("username", None)
+        cls.base_redis_init_kwargs.pop("password", None)
+        if config.db.redis:
+            cls.open_redis_client()
+            if was_listening:
+                cls.start_listener()
+        if old_pubsub_client:
+            await old_pubsub_client.close()
+        # Запросы, начатые до замены, еще выполняются на старом клиенте
+        await cls._close_when_idle(old_client)
+
+    @classmethod
+    async def _close_when_idle(cls, client: Union[aioredis.Redis, RedisCluster]) -> None:
+        """Закрывает клиент, когда все его соединения вернутся в пул.
+         Если за DRAIN_TIMEOUT запросы не завершились, клиент закрывается
+         вместе с занятыми соединениями.
+        Args:
+            client (aioredis.Redis | RedisCluster): Замененный клиент.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + cls.DRAIN_TIMEOUT
+        while loop.time() < deadline:
+            usage = cls._pool_usage(client)
+            if usage["created"] == usage["available"] and not usage["waiting"]:
+                break
+            await asyncio.sleep(cls.DRAIN_POLL_INTERVAL)
+        else:
+            cls.log.warning(f"Старый клиент Redis закрыт с незавершенными запросами через {cls.DRAIN_TIMEOUT} с.")
+        await cls._close_client(client)
+
+    @classmethod
+    async def _close_client(cls, client: Union[aioredis.Redis, RedisCluster]) -> None:
+        """Закрывает клиент вместе с соединениями пула.
+         aioredis.Redis.close освобождает только собственное соединение
+         клиента, соединения пула закрываются отдельно.
+        Args:
+            client (aioredis.Redis | RedisCluster): Клиент.
+        """
+        await client.close()
+        if not isinstance(client, RedisCluster):
+            await client.connection_pool.disconnect()
+
+    @classmethod
+    def is_cluster(cls) -> bool:
+        return isinstance(cls.redis_client, RedisCluster)
+
+    @classmethod
+    def pool_stats(cls) -> dict:
+        """Метрики пула соединений.
+        Returns:
+            dict: Режим, лимит соединений, количество созданных, занятых
+                и свободных соединений, число ожидающих соединения запросов
+                и доля занятых от лимита.
+        """
+        if cls.redis_client is None:
+            return {}
+
+        usage = cls._pool_usage(cls.redis_client)
+        in_use = usage["created"] - usage["available"]
+        return {
+            "mode": config.db.redis.mode,
+            "max_connections": usage["max_connections"],
+            "created": usage["created"],
+            "in_use": in_use,
+            "available": usage["available"],
+            "waiting": usage["waiting"],
+            "utilization": in_use / usage["max_connections"] if usage["max_connections"] else 0.0,
+        }
+
+    @classmethod
+    def _pool_usage(cls, client: Union[aioredis.Redis, RedisCluster]) -> dict:
+        if isinstance(client, RedisCluster):
+            nodes = client.get_nodes()
+            return {
+                "max_connections": sum(node.max_connections for node in nodes),
+                "created": sum(len(node._connections) for node in nodes),
+                "available": sum(len(node._free) for node in nodes),
+                "waiting": 0,
+            }
+        pool = client.connection_pool
+        if isinstance(pool, aioredis.BlockingConnectionPool):
+            return {
+                "max_connections": pool.max_connections,
+                "created": len(pool._connections),
+                "available": sum(1 for connection in pool.pool._queue if connection is not None),
+                "waiting": len(pool.pool._getters),
+            }
+        return {
+            "max_connections": pool.max_connections,
+            "created": pool._created_connections,
+            "available": len(pool._available_connections),
+            "waiting": 0,
+        }
+
+    @classmethod
+    def _nodes(cls) -> List[Tuple[str, int]]:
+        """Узлы из config.db.redis.nodes ("host:port,host:port"),
+         по умолчанию - host и port из конфигурации.
+        """
+        redis_config = config.db.redis
+        if not redis_config.nodes:
+            return [(redis_config.host, redis_config.port)]
+        nodes = []
+        for node in redis_config.nodes.split(","):
+            host, _, port = node.strip().rpartition(":")
+            nodes.append((host, int(port)))
+        return nodes
 
     @classmethod
     async def ping(cls):
@@ -81,7 +272,7 @@ class RedisClient(object):
         cls.log.debug("Сформирована Redis PING команда")
         try:
             return await redis_client.ping()
-        except RedisError as ex:
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis PING завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
@@ -89,7 +280,33 @@ class RedisClient(object):
             return False
 
     @classmethod
-    async def set(cls, key: str, value: str, expire: int = 2592000):
+    async def warmup(cls, connections: int) -> None:
+        """Открывает соединения пула и загружает Lua-скрипты до первых запросов.
+         Одновременные PING занимают разные соединения, поэтому в пуле
+         открывается до connections соединений (в режиме cluster - на узлах,
+         куда направлен PING). Зарегистрированные скрипты загружаются
+         командой SCRIPT LOAD, и первый EVALSHA не получает NOSCRIPT.
+        Args:
+            connections (int): Сколько соединений открыть.
+        Raises:
+            aioredis.RedisError: Если клиент Redis дал сбой при выполнении команды.
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug(f"Прогрев Redis: соединений {connections}, скриптов {len(cls.scripts)}")
+        try:
+            await asyncio.gather(*(redis_client.ping() for _ in range(connections)))
+            for source, _ in cls.scripts.values():
+                await redis_client.script_load(source)
+        except REDIS_ERRORS as ex:
+            cls.log.exception(
+                "Прогрев Redis завершен с исключением",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    async def set(cls, key: str, value: str, expire: int = 2592000, nx: bool = False):
         """Выполнить команду Redis SET.
          Установите ключ для хранения строкового значения. Если ключ уже содержит значение, оно
          перезаписывается независимо от его типа.
@@ -98,6 +315,7 @@ class RedisClient(object):
             value (str): Значение, которое необходимо установить.
             expire (int): Время в секундах, по истечении которого ключ будет удален.
             (по умолчанию 30 дней)
+            nx (bool): Установить, только если ключа еще нет.
         Returns:
             response: Ответ команды Redis SET, для получения дополнительной информации
                 look: https://redis.io/commands/set#return-value
@@ -108,15 +326,151 @@ class RedisClient(object):
 
         cls.log.debug(f"Сформирована Redis SET команда, key: {key}, value: {value}")
         try:
-            await redis_client.set(key, value)
-            await redis_client.expire(key, expire)
-        except RedisError as ex:
+            return await redis_client.set(key, value, ex=expire, nx=nx)
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis SET завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
             )
             raise ex
 
+    @classmethod
+    async def mset(cls, mapping: Mapping[str, str], expire: Optional[int] = None):
+        """Выполнить команду Redis MSET.
+         Устанавливает несколько ключей за один запрос. Если указан expire,
+         ключи устанавливаются командами SET ... EX в одной транзакции.
+        Args:
+            mapping (dict): Ключи и значения.
+            expire (int, optional): Время в секундах, по истечении которого ключи будут удалены.
+        Raises:
+            aioredis.RedisError: Если клиент Redis дал сбой при выполнении команды.
+        """
+        cls.log.debug(f"Сформирована Redis MSET команда, keys: {list(mapping)}")
+        try:
+            if cls.is_cluster():
+                # Ключи могут находиться в разных слотах
+                if expire is None:
+                    await cls.redis_client.mset_nonatomic(mapping)
+                    return
+                async with cls.redis_client.pipeline() as pipe:
+                    for key, value in mapping.items():
+                        pipe.set(key, value, ex=expire)
+                    await pipe.execute()
+                return
+            if expire is None:
+                await cls.redis_client.mset(mapping)
+                return
+            async with cls.redis_client.pipeline(transaction=True) as pipe:
+                for key, value in mapping.items():
+                    pipe.set(key, value, ex=expire)
+                await pipe.execute()
+        except REDIS_ERRORS as ex:
+            cls.log.exception(
+                "Команда Redis MSET завершена с исключением",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    async def mget(cls, keys: Sequence[str]) -> List[Optional[str]]:
+        """Выполнить команду Redis MGET.
+         Получает значения нескольких ключей за один запрос.
+        Args:
+            keys (list): Ключи.
+        Returns:
+            response: Значения в порядке ключей, None для отсутствующих.
+        Raises:
+            aioredis.RedisError: Если клиент Redis дал сбой при выполнении команды.
+        """
+        if not keys:
+            return []
+
+        cls.log.debug(f"Сформирована Redis MGET команда, keys: {keys}")
+        try:
+            if cls.is_cluster():
+                return await cls.redis_client.mget_nonatomic(keys)
+            return await cls.redis_client.mget(keys)
+        except REDIS_ERRORS as ex:
+            cls.log.exception(
+                "Команда Redis MGET завершена с исключением",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    @asynccontextmanager
+    async def pipeline(cls, transaction: bool = True) -> AsyncIterator[Pipeline]:
+        """Конвейер команд Redis.
+         Команды, добавленные в конвейер внутри блока, отправляются одним
+         запросом при выходе из блока (при transaction=True - в MULTI/EXEC).
+         Чтобы получить результаты, вызовите await pipe.execute() внутри блока.
+         В режиме cluster транзакции не поддерживаются, и команды выполняются
+         без MULTI/EXEC.
+        Args:
+            transaction (bool): Выполнять команды атомарно.
+        Yields:
+            aioredis.client.Pipeline: Конвейер.
+        Raises:
+            aioredis.RedisError: Если клиент Redis дал сбой при выполнении команд.
+        """
+        cls.log.debug("Сформирован Redis конвейер")
+        try:
+            if cls.is_cluster():
+                pipeline = cls.redis_client.pipeline()
+            else:
+                pipeline = cls.redis_client.pipeline(transaction=transaction)
+            async with pipeline as pipe:
+                yield pipe
+                if len(pipe):
+                    await pipe.execute()
+        except REDIS_ERRORS as ex:
+            cls.log.exception(
+                "Конвейер Redis завершен с исключением",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    def register_script(cls, name: str, source: str) -> None:
+        """Регистрирует Lua-скрипт.
+         Скрипт вызывается через EVALSHA и загружается на сервер
+         только при первом NOSCRIPT.
+        Args:
+            name (str): Имя скрипта.
+            source (str): Исходный код.
+        """
+        cls.scripts[name] = (source, hashlib.sha1(source.encode("utf-8")).hexdigest())
+
+    @classmethod
+    async def eval_script(cls, name: str, keys: Sequence[str] = (), args: Sequence[Any] = ()):
+        """Выполнить зарегистрированный Lua-скрипт командой EVALSHA.
+        Args:
+            name (str): Имя скрипта.
+            keys (list): Ключи (KEYS).
+            args (list): Аргументы (ARGV).
+        Returns:
+            response: Результат скрипта.
+        Raises:
+            aioredis.RedisError: Если клиент Redis дал сбой при выполнении команды.
+        """
+        redis_client = cls.redis_client
+        source, sha = cls.scripts[name]
+
+        cls.log.debug(f"Сформирована Redis EVALSHA команда, script: {name}, keys: {keys}")
+        try:
+            try:
+                return await redis_client.evalsha(sha, len(keys), *keys, *args)
+            except NO_SCRIPT_ERRORS:
+                # Кэш скриптов сервера сброшен (перезапуск, SCRIPT FLUSH, failover)
+                await redis_client.script_load(source)
+                return await redis_client.evalsha(sha, len(keys), *keys, *args)
+        except REDIS_ERRORS as ex:
+            cls.log.exception(
+                "Команда Redis EVALSHA завершена с исключением",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
     @classmethod
     async def rpush(cls, key, value):
         """Выполнить команду Redis RPUSH.
@@ -137,7 +491,7 @@ class RedisClient(object):
         cls.log.debug(f"Сформирована Redis RPUSH команда, key: {key}, value: {value}")
         try:
             await redis_client.rpush(key, value)
-        except RedisError as ex:
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis RPUSH завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
@@ -160,7 +514,7 @@ class RedisClient(object):
         cls.log.debug(f"Сформирована Redis EXISTS команда, key: {key}, exists")
         try:
             return await redis_client.exists(key)
-        except RedisError as ex:
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis EXISTS завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
@@ -185,7 +539,7 @@ class RedisClient(object):
         cls.log.debug(f"Сформирована Redis GET команда, key: {key}")
         try:
             return await redis_client.get(key)
-        except RedisError as ex:
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis GET завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
@@ -215,7 +569,7 @@ class RedisClient(object):
         cls.log.debug(f"Сформирована Redis LRANGE команда, key: {key}, start: {start}, end: {end}")
         try:
             return await redis_client.lrange(key, start, end)
-        except RedisError as ex:
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis LRANGE завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
@@ -229,9 +583,157 @@ class RedisClient(object):
         cls.log.debug(f"Сформирована Redis DELETE команда, key: {key}")
         try:
             return await redis_client.delete(key)
-        except RedisError as ex:
+        except REDIS_ERRORS as ex:
             cls.log.exception(
                 "Команда Redis DELETE завершена с исключением",
                 exc_info=(type(ex), ex, ex.__traceback__),
             )
             raise ex
+
+    @classmethod
+    async def publish(cls, channel: str, message: str):
+        """Выполнить команду Redis PUBLISH.
+         Отправляет сообщение всем подписчикам канала.
+        Args:
+            channel (str): Канал.
+            message (str): Сообщение.
+        Returns:
+            response: Количество клиентов, получивших сообщение.
+        Raises:
+            aioredis.RedisError: Если клиент Redis дал сбой при выполнении команды.
+        """
+        redis_client = cls.redis_client
+
+        cls.log.debug(f"Сформирована Redis PUBLISH команда, channel: {channel}, message: {message}")
+        try:
+            if cls.is_cluster():
+                # Сообщения PUBLISH распространяются на все узлы кластера
+                return await redis_client.execute_command(
+                    "PUBLISH", channel, message, target_nodes=RedisCluster.RANDOM
+                )
+            return await redis_client.publish(channel, message)
+        except REDIS_ERRORS as ex:
+            cls.log.exception(
+                "Команда Redis PUBLISH завершена с исключением",
+                exc_info=(type(ex), ex, ex.__traceback__),
+            )
+            raise ex
+
+    @classmethod
+    def subscribe(cls, channel: str, callback: Callable[[Optional[str]], None]) -> None:
+        """Регистрирует обработчик сообщений канала.
+         Сообщения читает общая задача, запускаемая start_listener.
+         При потере соединения обработчик вызывается с None: сообщения
+         могли быть пропущены, и зависящие от них локальные кэши нужно сбросить.
+        Args:
+            channel (str): Канал.
+            callback (callable): Обработчик, принимает текст сообщения или None.
+        """
+        cls.subscriptions.setdefault(channel, []).append(callback)
+
+    @classmethod
+    def start_listener(cls) -> None:
+        """Запускает задачу чтения сообщений pub/sub."""
+        if cls.listener_task is None and cls.subscriptions:
+            cls.listener_task = asyncio.create_task(cls._listen())
+
+    @classmethod
+    async def stop_listener(cls) -> None:
+        """Останавливает задачу чтения сообщений pub/sub."""
+        if cls.listener_task:
+            cls.listener_task.cancel()
+            try:
+                await cls.listener_task
+            except asyncio.CancelledError:
+                pass
+            cls.listener_task = None
+        cls.is_listening = False
+
+    @classmethod
+    def _reset_subscribers(cls) -> None:
+        for callbacks in cls.subscriptions.values():
+            for callback in callbacks:
+                callback(None)
+
+    @classmethod
+    def _pubsub_client(cls) -> aioredis.Redis:
+        """Клиент для подписки на каналы.
+         Подписка держит отдельное соединение без socket_timeout: в простое
+         сообщений может не быть дольше таймаута, и чтение обрывалось бы.
+         Мертвое соединение обнаруживает PING проверки health_check_interval
+         (см. _listen). Клиент Redis Cluster не поддерживает pub/sub, поэтому
+         в режиме cluster подписка выполняется на одном из узлов кластера;
+         при переподключении узлы перебираются по кругу.
+        """
+        if not cls.is_cluster():
+            pool = cls.redis_client.connection_pool
+            pool_kwargs = {**pool.connection_kwargs, "socket_timeout": None}
+            if isinstance(pool, aioredis.sentinel.SentinelConnectionPool):
+                pubsub_pool = aioredis.sentinel.SentinelConnectionPool(
+                    pool.service_name, pool.sentinel_manager, **pool_kwargs
+                )
+            else:
+                pubsub_pool = aioredis.ConnectionPool(connection_class=pool.connection_class, **pool_kwargs)
+            cls.pubsub_client = aioredis.Redis(connection_pool=pubsub_pool)
+            return cls.pubsub_client
+
+        nodes = cls._nodes()
+        cls.pubsub_node_index = (cls.pubsub_node_index + 1) % len(nodes)
+        host, port = nodes[cls.pubsub_node_index]
+        cls.pubsub_client = aioredis.Redis(
+            host=host,
+            port=port,
+            socket_timeout=None,
+            socket_connect_timeout=config.db.redis.socket_connect_timeout,
+            health_check_interval=config.db.redis.health_check_interval,
+            **cls.base_redis_init_kwargs,
+        )
+        return cls.pubsub_client
+
+    @classmethod
+    async def _listen(cls) -> None:
+        while True:
+            if cls.pubsub_client:
+                await cls.pubsub_client.close()
+                cls.pubsub_client = None
+            pubsub = cls._pubsub_client().pubsub()
+            try:
+                await pubsub.subscribe(*cls.subscriptions)
+                cls.is_listening = True
+                cls.log.debug("Подписка Redis pub/sub активна.")
+                # Сообщения, отправленные до подписки, потеряны
+                cls._reset_subscribers()
+                await cls._read_messages(pubsub)
+            except REDIS_ERRORS as ex:
+                cls.log.exception(
+                    "Подписка Redis pub/sub завершена с исключением",
+                    exc_info=(type(ex), ex, ex.__traceback__),
+                )
+            finally:
+                cls.is_listening = False
+                cls._reset_subscribers()
+                await pubsub.close()
+            await asyncio.sleep(cls.LISTENER_RETRY_DELAY)
+
+    @classmethod
+    async def _read_messages(cls, pubsub: PubSub) -> None:
+        """Доставляет сообщения подписчикам, пока соединение живо.
+         Ожидание сообщения ограничено health_check_interval, чтобы
+         get_message отправлял PING проверки. Если за следующий интервал
+         не пришел ни ответ на него, ни сообщение, соединение считается мертвым.
+        """
+        interval = config.db.redis.health_check_interval
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await pubsub.get_message(timeout=interval or None)
+            if message is None:
+                if interval and loop.time() > pubsub.connection.next_health_check + interval:
+                    raise aioredis.ConnectionError("Нет ответа на PING проверки подписки Redis")
+                continue
+            if message["type"] != "message":
+                continue
+            for callback in cls.subscriptions.get(message["channel"], ()):
+                callback(message["data"])
+
+
+ConfigWatcher.subscribe("db.redis", RedisClient.reload_redis_client)
@@ -4,3 +4,5 @@ from .auth import LoginResponse
 from .auth import RegisterResponse
 from .user import UserResponse
 from .user import UserOutResponse
+from .user import UsersPageResponse
+from .user import ImportRowError, ImportReportResponse
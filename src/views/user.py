@@ -1,6 +1,8 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, validator
 from tortoise import fields
-from models.schemas import User
+from src.models.schemas import User
 
 
 class UserResponse(User):
@@ -35,3 +37,23 @@ class UserOutResponse(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class UsersPageResponse(BaseModel):
+    users: List[User]
+    # Передается в cursor для получения следующей страницы, None - страница последняя
+    next_cursor: Optional[str]
+
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+
+class ImportReportResponse(BaseModel):
+    total: int
+    imported: int
+    failed: int
+    # Не больше первых 1000 ошибок
+    errors: List[ImportRowError]
+    rows_per_second: float
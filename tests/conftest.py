@@ -0,0 +1,119 @@
+"""
+Общие фикстуры тестов
+
+Конфигурация читается из временного файла (CONFIG_SOURCE=file), поэтому
+Consul не нужен. Тестам с фикстурой redis нужен Redis (REDIS_HOST,
+REDIS_PORT, по умолчанию localhost:6379), без него они пропускаются.
+
+Запуск из корня проекта:
+    python -m pytest
+"""
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+from typing import Callable
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+
+KV = {
+    "dev/is_secure_cookie": "0",
+    "base/name": "haha-ton",
+    "base/description": "tests",
+    "base/contact/name": "tests",
+    "base/contact/url": "http://localhost",
+    "base/contact/email": "tests@localhost",
+    "dev/jwt/JWT_ACCESS_SECRET_KEY": "access",
+    "dev/jwt/JWT_REFRESH_SECRET_KEY": "refresh",
+    "dev/database/postgresql/host": "localhost",
+    "dev/database/postgresql/port": "5432",
+    "dev/database/postgresql/username": "postgres",
+    "dev/database/postgresql/password": "postgres",
+    "dev/database/postgresql/name": "postgres",
+    "dev/database/redis/host": REDIS_HOST,
+    "dev/database/redis/password": "",
+    "dev/database/redis/port": str(REDIS_PORT),
+    "dev/database/s3/endpoint_url": "http://localhost:9000",
+    "dev/database/s3/region_name": "us-east-1",
+    "dev/database/s3/aws_access_key_id": "key",
+    "dev/database/s3/aws_secret_access_key": "secret",
+    "dev/database/s3/bucket": "bucket",
+    "base/email/isTLS": "1",
+    "base/email/isSSL": "0",
+    "base/email/host": "localhost",
+    "base/email/port": "587",
+    "base/email/user": "user",
+    "base/email/password": "password",
+}
+
+# До первого импорта src: модули читают конфигурацию при импорте
+CONFIG_DIRECTORY = tempfile.mkdtemp(prefix="haha-ton-tests-")
+CONFIG_FILE = os.path.join(CONFIG_DIRECTORY, "config.json")
+with open(CONFIG_FILE, "w", encoding="utf-8") as file:
+    json.dump({"haha-ton/" + key: value for key, value in KV.items()}, file)
+for name in [name for name in os.environ if name.startswith("CONFIG__")]:
+    # Переменные окружения переопределили бы ключи файла
+    del os.environ[name]
+os.environ.update(CONFIG_SOURCE="file", CONFIG_FILE=CONFIG_FILE, MODE="dev", DEBUG="1")
+# error_list.json и docs читаются относительно рабочего каталога, как в Dockerfile
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(CONFIG_DIRECTORY, ignore_errors=True)
+
+
+def is_redis_available() -> bool:
+    try:
+        socket.create_connection((REDIS_HOST, REDIS_PORT), timeout=0.5).close()
+    except OSError:
+        return False
+    return True
+
+
+@pytest.fixture
+def config_kv():
+    """Ключи конфигурации тестов без префикса haha-ton/"""
+    return dict(KV)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def redis():
+    """RedisClient с активной подпиской pub/sub, как после старта приложения"""
+    if not is_redis_available():
+        pytest.skip(f"Redis недоступен на {REDIS_HOST}:{REDIS_PORT}")
+    from src import utils
+
+    await utils.RedisClient.open_redis_client()
+    utils.RedisClient.start_listener()
+    await wait_until(lambda: utils.RedisClient.is_listening)
+    yield utils.RedisClient
+    await utils.RedisClient.stop_listener()
+    await utils.RedisClient.close_redis_client()
+
+
+async def wait_until(predicate: Callable[[], bool], timeout: float = 2.0) -> None:
+    """Ждет, пока predicate() не станет истинным, иначе AssertionError"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        assert loop.time() < deadline, "условие не выполнено за отведенное время"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def until():
+    return wait_until
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import copy
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src import config
+from src.services.auth import JWTManager
+
+pytestmark = pytest.mark.anyio
+
+PREFIX = "haha-ton/"
+# Сколько сервер держит блокирующий запрос без изменений (в Consul - wait)
+BLOCK_TIMEOUT = 0.5
+
+
+class BlockingConsulKV(BaseHTTPRequestHandler):
+    """
+    API Consul KV: как и Consul, держит блокирующий запрос (index, wait)
+    до изменения ключей
+    """
+    kv = {}
+    index = 10
+    requests = 0
+    changed = threading.Condition()
+
+    @classmethod
+    def put(cls, key: str, value: str) -> None:
+        with cls.changed:
+            cls.kv[PREFIX + key] = value
+            cls.index += 1
+            cls.changed.notify_all()
+
+    def do_GET(self):
+        type(self).requests += 1
+        url = urlparse(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        prefix = url.path[len("/v1/kv/"):]
+        with self.changed:
+            if "index" in query and int(query["index"][0]) >= self.index:
+                self.changed.wait(BLOCK_TIMEOUT)
+            index = self.index
+            items = [
+                {"Key": key, "Value": base64.b64encode(value.encode()).decode()}
+                for key, value in self.kv.items() if key.startswith(prefix)
+            ]
+        body = json.dumps(items).encode()
+        self.send_response(200)
+        self.send_header("X-Consul-Index", str(index))
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def consul(config_kv, monkeypatch, tmp_path):
+    handler = type("ConsulKV", (BlockingConsulKV,), {
+        "kv": {PREFIX + key: value for key, value in config_kv.items()},
+        "changed": threading.Condition(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("CONFIG_SOURCE", "consul")
+    monkeypatch.setenv("CONSUL_HOST", "127.0.0.1")
+    monkeypatch.setenv("CONSUL_PORT", str(server.server_address[1]))
+    monkeypatch.setenv("CONFIG_SNAPSHOT", str(tmp_path / "config.json"))
+    yield handler
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+async def watcher(consul, until):
+    """ConfigWatcher, получивший ключи; после теста конфигурация восстанавливается"""
+    original = copy.deepcopy(config.load_config())
+    config.ConfigWatcher.index = None
+    config.ConfigWatcher.start(asyncio.get_running_loop())
+    await until(lambda: config.ConfigWatcher.index is not None)
+    yield config.ConfigWatcher
+    config.ConfigWatcher.stop()
+    config.ConfigWatcher.apply(original)
+    await until(lambda: not config.ConfigWatcher.tasks)
+
+
+async def test_redis_client_recreated(redis, consul, watcher, until):
+    old_client = redis.redis_client
+    # Запрос на старом клиенте, который еще выполняется во время замены
+    in_flight = asyncio.ensure_future(old_client.blpop("config-watcher:empty", timeout=1))
+    await asyncio.sleep(0.1)
+
+    consul.put("dev/database/redis/max_connections", "7")
+
+    await until(lambda: redis.redis_client is not old_client)
+    new_client = redis.redis_client
+    assert new_client.connection_pool.max_connections == 7
+    assert await new_client.ping()
+    await until(lambda: redis.is_listening)
+    assert await in_flight is None
+    await until(lambda: not watcher.tasks)
+    assert not any(connection.is_connected for connection in old_client.connection_pool._connections)
+
+
+async def test_consecutive_changes_applied_in_order(redis, consul, watcher, until):
+    consul.put("dev/database/redis/max_connections", "8")
+    await asyncio.sleep(0.05)
+    consul.put("dev/database/redis/max_connections", "9")
+
+    await until(lambda: config.load_config().db.redis.max_connections == 9)
+    await until(lambda: not watcher.tasks, timeout=5.0)
+    assert redis.redis_client.connection_pool.max_connections == 9
+
+
+async def test_sections_applied_to_shared_config(consul, watcher, until):
+    current = config.load_config()
+
+    consul.put("dev/jwt/JWT_ACCESS_SECRET_KEY", "rotated")
+    consul.put("dev/database/s3/endpoint_url", "http://s3-2:9000")
+
+    await until(lambda: current.db.s3.endpoint_url == "http://s3-2:9000")
+    await until(lambda: JWTManager.JWT_ACCESS_SECRET_KEY == "rotated")
+    assert config.load_config() is current
+
+
+async def test_unparseable_value_not_applied(consul, watcher, until):
+    current = config.load_config()
+    reloads = watcher.reloads
+    requests = consul.requests
+
+    consul.put("dev/database/postgresql/port", "not-a-number")
+
+    # Следующий блокирующий запрос - значение уже разобрано
+    await until(lambda: consul.requests > requests)
+    assert current.db.postgresql.port == 5432
+    assert watcher.reloads == reloads
+
+
+async def test_snapshot_updated(consul, watcher, until, tmp_path):
+    consul.put("dev/database/s3/endpoint_url", "http://s3-3:9000")
+
+    await until(lambda: config.load_config().db.s3.endpoint_url == "http://s3-3:9000")
+    snapshot = config.read_kv_file(str(tmp_path / "config.json"))
+    assert snapshot[PREFIX + "dev/database/s3/endpoint_url"] == "http://s3-3:9000"
+
+
+async def test_idle_watcher_waits_for_changes(consul, watcher):
+    requests = consul.requests
+
+    await asyncio.sleep(BLOCK_TIMEOUT * 2.5)
+
+    # Без изменений запросы только продлевают ожидание
+    assert consul.requests - requests <= 3
@@ -0,0 +1,139 @@
+import random
+
+import pytest
+from fastapi import Response
+
+from src.services.auth import SessionManager
+
+pytestmark = pytest.mark.anyio
+
+GRACE_EXP = 30
+
+
+@pytest.fixture
+async def session(redis):
+    manager = SessionManager()
+    session_id = random.randint(10 ** 12, 10 ** 13)
+    yield manager, session_id
+    await manager.delete_session_id(session_id, Response())
+
+
+def grace_key(session_id: int, name: str) -> str:
+    return f"{{{session_id}}}:refresh_rotation:{name}"
+
+
+async def test_save_session(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-1")
+
+    assert await redis.get(str(session_id)) == "refresh-1"
+    assert 0 < await redis.redis_client.ttl(str(session_id)) <= SessionManager.REDIS_EXP
+    assert await manager.is_valid_session(session_id, "refresh-1")
+    assert not await manager.is_valid_session(session_id, "refresh-2")
+
+
+async def test_rotate_session(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-1")
+
+    key = grace_key(session_id, "1")
+    stored = await manager.rotate_session(session_id, "refresh-1", "refresh-2", key, "tokens-2", GRACE_EXP)
+
+    assert stored == "tokens-2"
+    assert await manager.is_valid_session(session_id, "refresh-2")
+    assert not await manager.is_valid_session(session_id, "refresh-1")
+    assert await redis.redis_client.hgetall(key) == {"refresh_token": "refresh-2", "value": "tokens-2"}
+    assert 0 < await redis.redis_client.ttl(key) <= GRACE_EXP
+    assert await redis.redis_client.smembers(manager.grace_index_key(session_id)) == {key}
+
+
+async def test_rotate_session_with_stale_token(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-2")
+
+    key = grace_key(session_id, "1")
+    assert await manager.rotate_session(session_id, "refresh-1", "refresh-3", key, "tokens-3", GRACE_EXP) is None
+    assert await manager.is_valid_session(session_id, "refresh-2")
+    assert not await redis.exists(key)
+
+
+async def test_grace_replay(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-1")
+    key = grace_key(session_id, "1")
+    await manager.rotate_session(session_id, "refresh-1", "refresh-2", key, "tokens-2", GRACE_EXP)
+
+    # Параллельный запрос с тем же refresh-токеном получает ту же пару
+    replayed = await manager.rotate_session(session_id, "refresh-1", "refresh-2b", key, "tokens-2b", GRACE_EXP)
+
+    assert replayed == "tokens-2"
+    assert await manager.is_valid_session(session_id, "refresh-2")
+
+
+async def test_grace_replay_after_next_rotation(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-1")
+    first, second = grace_key(session_id, "1"), grace_key(session_id, "2")
+    await manager.rotate_session(session_id, "refresh-1", "refresh-2", first, "tokens-2", GRACE_EXP)
+    await manager.rotate_session(session_id, "refresh-2", "refresh-3", second, "tokens-3", GRACE_EXP)
+
+    assert await manager.rotate_session(session_id, "refresh-1", "refresh-x", first, "tokens-x", GRACE_EXP) is None
+    assert await manager.is_valid_session(session_id, "refresh-3")
+
+
+async def test_grace_replay_after_delete(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-1")
+    key = grace_key(session_id, "1")
+    await manager.rotate_session(session_id, "refresh-1", "refresh-2", key, "tokens-2", GRACE_EXP)
+
+    await manager.delete_session_id(session_id, Response())
+
+    assert not await redis.exists(str(session_id))
+    assert not await redis.exists(key)
+    assert not await redis.exists(manager.grace_index_key(session_id))
+    assert await manager.rotate_session(session_id, "refresh-1", "refresh-2", key, "tokens-2", GRACE_EXP) is None
+    assert not await manager.is_valid_session(session_id, "refresh-2")
+
+
+async def test_scripts_reloaded_after_flush(redis, session):
+    manager, session_id = session
+    await redis.redis_client.script_flush()
+
+    await manager.save_session(session_id, "refresh-1")
+
+    assert await manager.is_valid_session(session_id, "refresh-1")
+    _, sha = redis.scripts["save_session"]
+    assert await redis.redis_client.script_exists(sha) == [True]
+
+
+async def test_cache_invalidated_by_other_worker(redis, session, until):
+    manager, session_id = session
+    key = str(session_id)
+    await manager.save_session(session_id, "refresh-1")
+    assert await manager.is_valid_session(session_id, "refresh-1")
+    assert SessionManager.cache.get(key) == "refresh-1"
+
+    # Другой воркер меняет сессию: локальный кэш этого воркера он не трогает
+    await redis.eval_script(
+        "save_session",
+        keys=[key],
+        args=["refresh-2", SessionManager.REDIS_EXP, SessionManager.INVALIDATION_CHANNEL, key]
+    )
+
+    await until(lambda: SessionManager.cache.get(key) is None)
+    assert await manager.is_valid_session(session_id, "refresh-2")
+    assert not await manager.is_valid_session(session_id, "refresh-1")
+
+
+async def test_cache_cleared_when_subscription_stops(redis, session):
+    manager, session_id = session
+    await manager.save_session(session_id, "refresh-1")
+    assert await manager.is_valid_session(session_id, "refresh-1")
+
+    await redis.stop_listener()
+
+    assert SessionManager.cache.get(str(session_id)) is None
+    # Без подписки сессия читается из redis
+    await redis.set(str(session_id), "refresh-2")
+    assert await manager.is_valid_session(session_id, "refresh-2")
@@ -0,0 +1,110 @@
+import asyncio
+import random
+from datetime import datetime
+
+import pytest
+
+from src.models import schemas
+from src.services.repository.cache import UserCache
+
+pytestmark = pytest.mark.anyio
+
+
+def make_user(user_id: int, username: str = "cached") -> schemas.User:
+    now = datetime(2024, 1, 1)
+    return schemas.User(
+        id=user_id,
+        username=username,
+        email=f"{username}@localhost",
+        full_name=username,
+        first_name=None,
+        last_name=None,
+        role_id=11,
+        state_id=1,
+        create_time=now,
+        update_time=now,
+    )
+
+
+@pytest.fixture
+async def user_ids(redis):
+    ids = [random.randint(10 ** 12, 10 ** 13) for _ in range(2)]
+    yield ids
+    for user_id in ids:
+        UserCache.local.pop(user_id)
+        await redis.delete(UserCache.REDIS_PREFIX + str(user_id))
+
+
+async def test_cached_after_read(redis, user_ids):
+    user_id, _ = user_ids
+    user = make_user(user_id)
+
+    await UserCache.set_many({user_id: user})
+
+    assert UserCache.local.get(user_id) == user
+    UserCache.local.pop(user_id)
+    assert await UserCache.get_many([user_id]) == {user_id: user}
+    assert 0 < await redis.redis_client.ttl(UserCache.REDIS_PREFIX + str(user_id)) <= UserCache.REDIS_EXP
+
+
+async def test_missing_user_cached_negatively(redis, user_ids):
+    user_id, _ = user_ids
+
+    await UserCache.set_many({user_id: None})
+
+    UserCache.local.pop(user_id)
+    assert await UserCache.get_many([user_id]) == {user_id: ""}
+    assert 0 < await redis.redis_client.ttl(UserCache.REDIS_PREFIX + str(user_id)) <= UserCache.NEGATIVE_EXP
+
+
+async def test_stale_read_not_cached_after_invalidate(redis, user_ids):
+    user_id, _ = user_ids
+    # Чтение из БД началось до изменения пользователя...
+    assert await UserCache.get_many([user_id]) == {}
+    stale = make_user(user_id, "old_name")
+
+    # ...изменение завершилось раньше, чем прочитанная запись попала в кэш
+    await UserCache.invalidate(user_id)
+    await UserCache.set_many({user_id: stale})
+
+    assert await redis.get(UserCache.REDIS_PREFIX + str(user_id)) == UserCache.TOMBSTONE
+    assert UserCache.local.get(user_id) is None
+    assert await UserCache.get_many([user_id]) == {}
+
+
+async def test_stale_read_not_cached_after_invalidate_many(redis, user_ids):
+    await UserCache.invalidate_many(user_ids)
+    await UserCache.set_many({user_id: make_user(user_id) for user_id in user_ids})
+
+    for user_id in user_ids:
+        assert await redis.get(UserCache.REDIS_PREFIX + str(user_id)) == UserCache.TOMBSTONE
+        assert UserCache.local.get(user_id) is None
+    assert await UserCache.get_many(user_ids) == {}
+
+
+async def test_cached_again_after_tombstone_expires(redis, user_ids, monkeypatch):
+    user_id, _ = user_ids
+    monkeypatch.setattr(UserCache, "TOMBSTONE_EXP", 1)
+    await UserCache.invalidate(user_id)
+
+    await asyncio.sleep(1.1)
+    user = make_user(user_id, "new_name")
+    await UserCache.set_many({user_id: user})
+
+    assert await UserCache.get_many([user_id]) == {user_id: user}
+
+
+async def test_local_entry_invalidated_by_other_worker(redis, user_ids, until):
+    user_id, other_id = user_ids
+    await UserCache.set_many({user_id: make_user(user_id), other_id: make_user(other_id)})
+
+    # Другой воркер изменил пользователя: локальный уровень этого воркера он не трогает
+    await redis.eval_script(
+        "invalidate_user",
+        keys=[UserCache.REDIS_PREFIX + str(user_id)],
+        args=[UserCache.TOMBSTONE, UserCache.TOMBSTONE_EXP, UserCache.INVALIDATION_CHANNEL, user_id]
+    )
+
+    await until(lambda: UserCache.local.get(user_id) is None)
+    assert await UserCache.get_many([user_id]) == {}
+    assert UserCache.local.get(other_id) is not None